@@ -0,0 +1,137 @@
+"""Cold-start cost: module import time and time to first response.
+
+Each run starts a fresh interpreter that imports main, then sends the first
+request to each endpoint straight through the ASGI app, the way a serverless
+function handles its first invocation. /api/tts asks for the playground demo
+phrase against the stub upstream, so a bundled snapshot shows up as a HIT.
+Reports the median and worst run, and which heavy modules the import pulled in.
+
+Run with:  python bench/coldstart.py --runs 10 --snapshot cache-snapshot.zip
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from concurrency import ROOT, start_process, wait_until_up
+
+PATHS = [
+    ("/", ""),
+    ("/api/voices", ""),
+    ("/api/health", ""),
+    ("/api/tts", "voice=Sam&text=This+is+a+demonstration+of+the+Sam+voice.&format=wav"),
+]
+
+HEAVY_MODULES = ["httpx", "numpy", "redis", "brotli"]
+
+# Runs in the child: everything before "import main" is the interpreter's own start-up
+PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def first_response(path, query):
+    messages = []
+    requests = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        # After the request body, the client never disconnects
+        if requests:
+            return requests.pop()
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "client": ("127.0.0.1", 50000), "server": ("localhost", 80),
+        "headers": [(b"host", b"localhost"), (b"accept-encoding", b"br, gzip")],
+    }
+    started = time.perf_counter()
+    await main.app(scope, receive, send)
+    headers = dict(messages[0]["headers"])
+    return {
+        "ms": (time.perf_counter() - started) * 1000,
+        "status": messages[0]["status"],
+        "cache": headers.get(b"x-cache", b"").decode(),
+    }
+
+async def probe(paths):
+    return {path: await first_response(path, query) for path, query in paths}
+
+modules = [name for name in %(heavy)r if name in sys.modules]
+responses = asyncio.run(probe(%(paths)r))
+print(json.dumps({"import_ms": (imported - started) * 1000, "modules": modules, "responses": responses}))
+"""
+
+def run_once(env):
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE % {"heavy": HEAVY_MODULES, "paths": PATHS}],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+async def wait_for_stub(url):
+    async with httpx.AsyncClient(timeout=10) as client:
+        await wait_until_up(client, url)
+
+def report(name, values):
+    print(f"{name:>24} {statistics.median(values):9.1f} {max(values):9.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--snapshot", default="", help="TTS_CACHE_SNAPSHOT for the measured processes")
+    parser.add_argument("--brotli-quality", default="", help="TTS_STATIC_BROTLI_QUALITY for the measured processes")
+    parser.add_argument("--latency", type=float, default=1.0, help="stub upstream latency in seconds")
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--json", help="write the raw runs to this file")
+    args = parser.parse_args()
+
+    env = dict(os.environ, TETYYS_URL=f"http://127.0.0.1:{args.stub_port}/SAPI4/SAPI4", TTS_CACHE_SNAPSHOT=args.snapshot)
+    if args.brotli_quality:
+        env["TTS_STATIC_BROTLI_QUALITY"] = args.brotli_quality
+
+    stub = start_process(["bench/stub_upstream.py", "--port", str(args.stub_port), "--latency", str(args.latency)])
+    try:
+        asyncio.run(wait_for_stub(f"http://127.0.0.1:{args.stub_port}/stub/faults"))
+        # One throwaway run so every measured run starts with warm bytecode and page caches
+        run_once(env)
+        runs = [run_once(env) for _ in range(args.runs)]
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    print(f"{'':>24} {'p50 ms':>9} {'max ms':>9}")
+    report("process total", [run["process_ms"] for run in runs])
+    report("import main", [run["import_ms"] for run in runs])
+    for path, _ in PATHS:
+        report(f"first {path}", [run["responses"][path]["ms"] for run in runs])
+    last = runs[-1]
+    print(f"modules loaded at import: {', '.join(last['modules']) or 'none'}")
+    print("first responses: " + ", ".join(
+        f"{path} {response['status']}{' ' + response['cache'] if response['cache'] else ''}"
+        for path, response in last["responses"].items()
+    ))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(runs, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Tail latency of /api/health while slow /api/tts calls are in flight.
+
+Starts the stub upstream and the API (one uvicorn worker) as subprocesses,
+fires N concurrent /api/tts requests against a slow upstream and probes
+/api/health at a fixed interval for the duration.
+
+Run with:  python bench/concurrency.py --slow 20 --latency 2.0
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def start_process(args, env=None):
+    return subprocess.Popen(
+        [sys.executable] + args,
+        cwd=ROOT,
+        env=dict(os.environ, **(env or {})),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+async def wait_until_up(client, url, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get(url)
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+async def run(args):
+    api = f"http://127.0.0.1:{args.api_port}"
+    async with httpx.AsyncClient(timeout=60) as client:
+        await wait_until_up(client, f"http://127.0.0.1:{args.stub_port}/docs")
+        await wait_until_up(client, f"{api}/api/health")
+
+        async def slow_call(i):
+            response = await client.get(f"{api}/api/tts", params={"voice": "Sam", "text": f"Request number {i}"})
+            return response.status_code
+
+        async def probe(stop):
+            latencies = []
+            while not stop.is_set():
+                started = time.perf_counter()
+                await client.get(f"{api}/api/health")
+                latencies.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(args.interval)
+            return latencies
+
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe(stop))
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(slow_call(i) for i in range(args.slow)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        latencies = await prober
+
+    print(f"slow /api/tts calls: {args.slow} x {args.latency:.1f}s upstream, finished in {elapsed:.2f}s")
+    print(f"  statuses: {sorted(set(statuses))}")
+    print(f"/api/health probes: {len(latencies)}")
+    print(f"  p50 {statistics.median(latencies):8.1f} ms")
+    print(f"  p95 {percentile(latencies, 95):8.1f} ms")
+    print(f"  p99 {percentile(latencies, 99):8.1f} ms")
+    print(f"  max {max(latencies):8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--slow", type=int, default=20, help="concurrent slow /api/tts calls")
+    parser.add_argument("--latency", type=float, default=2.0, help="stub upstream latency in seconds")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between health probes")
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--api-port", type=int, default=8901)
+    args = parser.parse_args()
+
+    stub = start_process(["bench/stub_upstream.py", "--port", str(args.stub_port), "--latency", str(args.latency)])
+    server = start_process(
+        ["-m", "uvicorn", "main:app", "--port", str(args.api_port), "--log-level", "warning"],
+        env={"TETYYS_URL": f"http://127.0.0.1:{args.stub_port}/SAPI4/SAPI4"},
+    )
+    try:
+        asyncio.run(run(args))
+    finally:
+        server.terminate()
+        stub.terminate()
+        server.wait()
+        stub.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Scripted load scenarios against /api/tts, /api/voices and /.
+
+Each scenario gets a fresh API process (one uvicorn worker) in front of the
+stub upstream, so throughput, latency percentiles and memory are measured
+from the same starting point every run:
+
+  burst   - a wall of concurrent requests for distinct phrases
+  steady  - an open-loop mix of endpoints at a fixed request rate
+  skew    - phrases drawn from a Zipf distribution, so most are repeats
+  long    - /api/tts/long with multi-paragraph texts
+
+Run with:  python bench/load.py --scenarios burst,skew --json results.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from concurrency import percentile, start_process, wait_until_up
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while seven wizards quietly "
+    "box with jovial daring and a sphinx of black quartz judges every vow"
+).split()
+
+def phrase(rng, words=8):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def memory_kb(pid):
+    # (current RSS, peak RSS) in kB, from /proc where available
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return None, None
+    return int(fields["VmRSS"].split()[0]), int(fields["VmHWM"].split()[0])
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+
+    async def call(self, client, label, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.latencies.setdefault(label, []).append((time.perf_counter() - started) * 1000)
+        self.statuses.setdefault(label, {}).setdefault(status, 0)
+        self.statuses[label][status] += 1
+
+async def burst(client, api, recorder, args, rng):
+    await asyncio.gather(*(
+        recorder.call(client, "tts", "GET", f"{api}/api/tts", params={"voice": "Sam", "text": phrase(rng), "format": "wav"})
+        for _ in range(args.requests)
+    ))
+
+async def steady(client, api, recorder, args, rng):
+    # Open loop: requests go out on schedule whether or not earlier ones have finished
+    pending = []
+    started = time.perf_counter()
+    for i in range(int(args.rate * args.duration)):
+        delay = started + i / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        roll = rng.random()
+        if roll < 0.7:
+            call = recorder.call(client, "tts", "GET", f"{api}/api/tts", params={"voice": rng.choice(["Sam", "Mary", "Mike"]), "text": phrase(rng), "format": "wav"})
+        elif roll < 0.9:
+            call = recorder.call(client, "voices", "GET", f"{api}/api/voices")
+        else:
+            call = recorder.call(client, "landing", "GET", f"{api}/", headers={"Accept-Encoding": "gzip, br"})
+        pending.append(asyncio.ensure_future(call))
+    await asyncio.gather(*pending)
+
+async def skew(client, api, recorder, args, rng):
+    phrases = [phrase(rng) for _ in range(args.phrases)]
+    weights = [1 / rank ** args.zipf for rank in range(1, len(phrases) + 1)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def call(text):
+        async with semaphore:
+            await recorder.call(client, "tts", "GET", f"{api}/api/tts", params={"voice": "Sam", "text": text, "format": "wav"})
+
+    await asyncio.gather(*(call(text) for text in rng.choices(phrases, weights, k=args.requests)))
+
+async def long_text(client, api, recorder, args, rng):
+    semaphore = asyncio.Semaphore(max(1, args.concurrency // 4))
+
+    async def call():
+        text = " ".join(phrase(rng, 12) for _ in range(args.sentences))
+        async with semaphore:
+            await recorder.call(client, "long", "POST", f"{api}/api/tts/long", json={"voice": "Sam", "text": text})
+
+    await asyncio.gather(*(call() for _ in range(max(1, args.requests // 10))))
+
+SCENARIOS = {"burst": burst, "steady": steady, "skew": skew, "long": long_text}
+
+async def run_scenario(name, args, server):
+    api = f"http://127.0.0.1:{args.api_port}"
+    stub = f"http://127.0.0.1:{args.stub_port}"
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=1000, max_keepalive_connections=1000)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        await wait_until_up(client, f"{stub}/stub/faults")
+        await wait_until_up(client, f"{api}/api/health")
+        await client.post(f"{stub}/stub/faults", json={
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "audio_seconds": args.audio_seconds,
+        })
+        rss_before, _ = memory_kb(server.pid)
+        started = time.perf_counter()
+        await SCENARIOS[name](client, api, recorder, args, rng)
+        elapsed = time.perf_counter() - started
+        rss_after, rss_peak = memory_kb(server.pid)
+    result = {"scenario": name, "seconds": round(elapsed, 3), "rss_before_kb": rss_before, "rss_after_kb": rss_after, "rss_peak_kb": rss_peak, "endpoints": {}}
+    for label, latencies in recorder.latencies.items():
+        result["endpoints"][label] = {
+            "requests": len(latencies),
+            "statuses": {str(status): count for status, count in recorder.statuses[label].items()},
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+        }
+    return result
+
+def print_result(result):
+    memory = "n/a"
+    if result["rss_after_kb"] is not None:
+        memory = f"rss {result['rss_before_kb'] / 1024:.1f} -> {result['rss_after_kb'] / 1024:.1f} MB, peak {result['rss_peak_kb'] / 1024:.1f} MB"
+    print(f"{result['scenario']}: {result['seconds']:.2f}s, {memory}")
+    for label, stats in result["endpoints"].items():
+        print(
+            f"  {label:>8}: {stats['requests']:5d} req {stats['throughput_rps']:8.1f} req/s"
+            f"  p50 {stats['p50_ms']:8.1f}  p95 {stats['p95_ms']:8.1f}  p99 {stats['p99_ms']:8.1f} ms  {stats['statuses']}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario (long sends a tenth as many)")
+    parser.add_argument("--concurrency", type=int, default=50, help="client concurrency for skew and long")
+    parser.add_argument("--rate", type=float, default=50, help="steady: requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="steady: seconds")
+    parser.add_argument("--phrases", type=int, default=50, help="skew: distinct phrases")
+    parser.add_argument("--zipf", type=float, default=1.1, help="skew: Zipf exponent")
+    parser.add_argument("--sentences", type=int, default=20, help="long: sentences per text")
+    parser.add_argument("--latency", type=float, default=0.3, help="stub upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--audio-seconds", type=float, default=1.0, help="stub payload length")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write results to this file")
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--api-port", type=int, default=8901)
+    args = parser.parse_args()
+
+    results = []
+    stub = start_process(["bench/stub_upstream.py", "--port", str(args.stub_port)])
+    try:
+        for name in args.scenarios.split(","):
+            server = start_process(
+                ["-m", "uvicorn", "main:app", "--port", str(args.api_port), "--log-level", "warning"],
+                env={"TETYYS_URL": f"http://127.0.0.1:{args.stub_port}/SAPI4/SAPI4"},
+            )
+            try:
+                result = asyncio.run(run_scenario(name.strip(), args, server))
+            finally:
+                server.terminate()
+                server.wait()
+            print_result(result)
+            results.append(result)
+    finally:
+        stub.terminate()
+        stub.wait()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
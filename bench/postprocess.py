@@ -0,0 +1,45 @@
+"""Cost of the audio post-processing stage per clip.
+
+Times voicecraft.process_wav on synthetic clips of several lengths for each
+processing option on its own and all of them combined, and reports the
+median and p95 milliseconds per clip alongside the clip length.
+
+Run with:  python bench/postprocess.py --repeat 50
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from concurrency import ROOT, percentile
+from stub_upstream import make_wav
+
+sys.path.insert(0, ROOT)
+import main as voicecraft  # noqa: E402
+
+SPECS = ["trim", "peak", "rms", "16000hz", "44100hz", "2ch", "trim.rms.16000hz.2ch"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", default="1,5,20", help="comma-separated clip lengths")
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+    if not voicecraft.NUMPY_AVAILABLE:
+        sys.exit("numpy is not installed")
+    # Imported on first use, which would otherwise land in the first timing
+    voicecraft.load_numpy()
+
+    print(f"{'spec':>22} {'clip':>6} {'p50 ms':>9} {'p95 ms':>9} {'x realtime':>11}")
+    for seconds in (float(value) for value in args.seconds.split(",")):
+        clip = make_wav(seconds)
+        for spec in SPECS:
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                voicecraft.process_wav(clip, spec)
+                timings.append((time.perf_counter() - started) * 1000)
+            median = statistics.median(timings)
+            print(f"{spec:>22} {seconds:5.0f}s {median:9.2f} {percentile(timings, 95):9.2f} {seconds * 1000 / median:11.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Drive /api/tts through upstream degradation, outage and recovery.
+
+Uses the fault-injecting stub to walk through phases and reports status
+codes, latency and the circuit breaker state seen in /api/health.
+
+Run with:  python bench/resilience.py --requests 60
+"""
+import argparse
+import asyncio
+import collections
+import time
+
+import httpx
+
+from concurrency import percentile, start_process, wait_until_up
+
+# (name, stub faults, seconds to wait before the phase)
+PHASES = [
+    ("healthy", {"error_rate": 0.0, "latency": 0.2}, 0),
+    ("flaky", {"error_rate": 0.2, "latency": 0.2}, 0),
+    ("outage", {"error_rate": 1.0, "latency": 0.2}, 0),
+    ("recovery", {"error_rate": 0.0, "latency": 0.2}, 2.5),
+    ("slow tail", {"error_rate": 0.0, "latency": 0.2, "jitter": 0.2}, 0),
+]
+
+async def run_phase(client, api, name, count, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = collections.Counter()
+
+    async def call(i):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(
+                f"{api}/api/tts",
+                params={"voice": "Sam", "text": f"{name} request {i} {time.time()}", "format": "wav"},
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] += 1
+
+    await asyncio.gather(*(call(i) for i in range(count)))
+    health = (await client.get(f"{api}/api/health")).json()
+    print(f"{name:>10}: {dict(sorted(statuses.items()))}")
+    print(f"{'':>10}  p50 {percentile(latencies, 50):7.1f} ms  p95 {percentile(latencies, 95):7.1f} ms")
+    # Only HTTP backends carry a breaker and retry budget
+    for backend in health["backends"]:
+        if "breaker" in backend:
+            print(f"{'':>10}  {backend['name']}: breaker {backend['breaker']}  retries {backend['retries']}  hedges {backend['hedges']}")
+
+async def run(args):
+    api = f"http://127.0.0.1:{args.api_port}"
+    stub = f"http://127.0.0.1:{args.stub_port}"
+    async with httpx.AsyncClient(timeout=60) as client:
+        await wait_until_up(client, f"{stub}/stub/faults")
+        await wait_until_up(client, f"{api}/api/health")
+        for name, faults, pause in PHASES:
+            await asyncio.sleep(pause)
+            await client.post(f"{stub}/stub/faults", json={"jitter": 0.0, **faults})
+            await run_phase(client, api, name, args.requests, args.concurrency)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=60, help="requests per phase")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--api-port", type=int, default=8901)
+    args = parser.parse_args()
+
+    stub = start_process(["bench/stub_upstream.py", "--port", str(args.stub_port), "--latency", "0.2"])
+    server = start_process(
+        ["-m", "uvicorn", "main:app", "--port", str(args.api_port), "--log-level", "warning"],
+        env={
+            "TETYYS_URL": f"http://127.0.0.1:{args.stub_port}/SAPI4/SAPI4",
+            "UPSTREAM_HEDGE": "1",
+            "UPSTREAM_HEDGE_MIN_DELAY": "0.1",
+            # Phases last a few seconds, so shrink the breaker window to match
+            "UPSTREAM_BREAKER_WINDOW": "2",
+            "UPSTREAM_BREAKER_COOLDOWN": "2",
+        },
+    )
+    try:
+        asyncio.run(run(args))
+    finally:
+        server.terminate()
+        stub.terminate()
+        server.wait()
+        stub.wait()
+
+if __name__ == "__main__":
+    main()
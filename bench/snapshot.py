@@ -0,0 +1,43 @@
+"""Build a warm-cache snapshot to bundle with a serverless deployment.
+
+Synthesizes the warm-up manifest (the playground's demo phrase in every voice
+unless one is given) through the configured backends, then writes the cache
+and the static assets, compressed at full quality, to a zip for
+TTS_CACHE_SNAPSHOT to point at.
+
+Run with:  python bench/snapshot.py cache-snapshot.zip --manifest warmup.json
+"""
+import argparse
+import asyncio
+import sys
+
+from concurrency import ROOT
+
+sys.path.insert(0, ROOT)
+import main as voicecraft  # noqa: E402
+
+async def build(args):
+    items = voicecraft.load_warmup_manifest(args.manifest)
+    try:
+        await voicecraft.warm_cache(items, args.concurrency)
+    finally:
+        if voicecraft.upstream_client is not None:
+            await voicecraft.upstream_client.aclose()
+    return voicecraft.warmup_progress
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", help="zip file to write")
+    parser.add_argument("--manifest", default="", help="warm-up manifest, as for TTS_WARMUP_MANIFEST")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    progress = asyncio.run(build(args))
+    entries, assets = voicecraft.write_cache_snapshot(args.path)
+    print(f"warmed {progress['completed']} of {progress['total']} ({progress['failed']} failed)")
+    print(f"wrote {entries} cache entries and {assets} static assets to {args.path}")
+    if progress["failed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
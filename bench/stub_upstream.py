@@ -0,0 +1,84 @@
+"""Local stand-in for the Tetyys /SAPI4/SAPI4 endpoint.
+
+Faults and the payload size can be set at start-up or changed at runtime by
+POSTing a JSON object with any of the settings below to /stub/faults.
+
+Run with:  python bench/stub_upstream.py --port 8900 --latency 2.0 --error-rate 0.2
+"""
+import argparse
+import asyncio
+import io
+import math
+import random
+import wave
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+import uvicorn
+
+SAMPLE_RATE = 22050
+
+def make_wav(seconds):
+    frames = int(SAMPLE_RATE * seconds)
+    pcm = bytearray()
+    for i in range(frames):
+        sample = int(8000 * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE))
+        pcm += sample.to_bytes(2, "little", signed=True)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(bytes(pcm))
+    return buffer.getvalue()
+
+def create_app(latency=0.0, audio_seconds=1.0, jitter=0.0, error_rate=0.0, error_status=503):
+    app = FastAPI()
+    faults = {
+        "latency": latency,
+        "jitter": jitter,
+        "error_rate": error_rate,
+        "error_status": error_status,
+        "audio_seconds": audio_seconds,
+    }
+    stats = {"requests": 0, "errors": 0}
+    payloads = {audio_seconds: make_wav(audio_seconds)}
+
+    @app.get("/SAPI4/SAPI4")
+    async def sapi4(text: str = "", voice: str = "", pitch: int = 150, speed: int = 150):
+        stats["requests"] += 1
+        await asyncio.sleep(max(0.0, faults["latency"] + random.uniform(-faults["jitter"], faults["jitter"])))
+        if random.random() < faults["error_rate"]:
+            stats["errors"] += 1
+            return Response(content=b"stub error", status_code=faults["error_status"])
+        seconds = faults["audio_seconds"]
+        if seconds not in payloads:
+            payloads[seconds] = make_wav(seconds)
+        return Response(content=payloads[seconds], media_type="audio/wav")
+
+    @app.post("/stub/faults")
+    async def set_faults(settings: dict):
+        faults.update({name: value for name, value in settings.items() if name in faults})
+        return {"faults": faults, "stats": stats}
+
+    @app.get("/stub/faults")
+    async def get_faults():
+        return {"faults": faults, "stats": stats}
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=2.0, help="seconds before responding")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform +/- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--audio-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+    app = create_app(args.latency, args.audio_seconds, args.jitter, args.error_rate, args.error_status)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
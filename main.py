@@ -1,11 +1,105 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse, HTMLResponse
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import requests
-import io
-import urllib.parse
+from pydantic import BaseModel
+from array import array
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import base64
+import bisect
+import contextvars
+import gzip
+import hashlib
+import heapq
+import html
+import importlib.util
+import json
+import logging
+import math
+import os
+import random
+import re
+import shutil
+import sqlite3
+import struct
+import tempfile
+import time
+import uuid
+import zlib
+import zipfile
 
-app = FastAPI(title="VoiceCraft Pro - SAPI4 TTS API", version="1.0.0")
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import lameenc
+except ImportError:
+    lameenc = None
+
+# Heavy optional and upstream-only modules are imported on first use to keep cold starts short
+httpx = None
+np = None
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+REDIS_AVAILABLE = importlib.util.find_spec("redis") is not None
+
+def load_numpy():
+    global np
+    if np is None:
+        import numpy as np
+    return np
+
+logger = logging.getLogger("voicecraft")
+
+# Upstream Tetyys SAPI4 endpoint
+TETYYS_URL = os.environ.get("TETYYS_URL", "https://www.tetyys.com/SAPI4/SAPI4")
+UPSTREAM_TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", "30"))
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.environ.get("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_CONCURRENCY = int(os.environ.get("UPSTREAM_CONCURRENCY", "32"))
+
+# Synthesis backends, in routing order; a voice served by several fails over down the list
+TTS_BACKENDS = os.environ.get("TTS_BACKENDS", "tetyys")
+SAPI4_LOCAL_URL = os.environ.get("SAPI4_LOCAL_URL", "")
+SAPI4_LOCAL_CONCURRENCY = int(os.environ.get("SAPI4_LOCAL_CONCURRENCY", "4"))
+ESPEAK_PATH = os.environ.get("ESPEAK_PATH", "espeak-ng")
+ESPEAK_CONCURRENCY = int(os.environ.get("ESPEAK_CONCURRENCY", str(os.cpu_count() or 2)))
+FAKE_LATENCY = float(os.environ.get("TTS_FAKE_LATENCY", "0"))
+
+# Shared keep-alive connection pool to the upstream, one per worker
+upstream_client = None
+
+def get_upstream_client():
+    # Created on first use, so cached and static responses never pay for importing httpx
+    global upstream_client, httpx
+    if httpx is None:
+        import httpx
+    if upstream_client is None:
+        upstream_client = httpx.AsyncClient(
+            timeout=UPSTREAM_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                keepalive_expiry=30,
+            ),
+        )
+    return upstream_client
+
+@asynccontextmanager
+async def lifespan(app):
+    global upstream_client
+    start_job_workers()
+    start_warmup()
+    yield
+    await stop_warmup()
+    await stop_job_workers()
+    if upstream_client is not None:
+        await upstream_client.aclose()
+        upstream_client = None
+
+app = FastAPI(title="VoiceCraft Pro - SAPI4 TTS API", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -16,8 +110,215 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Available voices from Tetyys SAPI4
-AVAILABLE_VOICES = [
+# Prometheus-style metrics
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Metric:
+    def __init__(self, name, kind, description, labels=()):
+        self.name = name
+        self.kind = kind
+        self.description = description
+        self.labels = labels
+        self.values = {}
+        METRICS.append(self)
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.labels, values)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{self._label_text(values)} {value}")
+        return lines
+
+class Counter(Metric):
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, "counter", description, labels)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, "gauge", description, labels)
+
+    def set(self, value, **labels):
+        self.values[tuple(labels.get(name, "") for name in self.labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+class Histogram(Metric):
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, "histogram", description, labels)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        series = self.values.get(key)
+        if series is None:
+            # Per-bucket counts, then sum and count
+            series = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for values, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._label_text(values, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._label_text(values, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{self._label_text(values)} {series[-2]}")
+            lines.append(f"{self.name}_count{self._label_text(values)} {series[-1]}")
+        return lines
+
+METRICS = []
+HTTP_REQUESTS = Counter("voicecraft_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_DURATION = Histogram("voicecraft_http_request_duration_seconds", "Time from request to last body byte", ("route",))
+HTTP_IN_FLIGHT = Gauge("voicecraft_http_requests_in_flight", "Requests currently being served")
+HTTP_BYTES = Counter("voicecraft_http_response_bytes_total", "Response body bytes served", ("route",))
+TTS_STAGE_DURATION = Histogram("voicecraft_tts_stage_duration_seconds", "Time spent per pipeline stage", ("stage", "voice"))
+UPSTREAM_RESPONSES = Counter("voicecraft_upstream_responses_total", "Upstream responses by backend and status", ("backend", "status"))
+
+# Per-request stage timings, shared with background tasks started on the request's behalf
+request_metrics = contextvars.ContextVar("request_metrics", default=None)
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.voice = ""
+
+    def record(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self):
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        entries.append(f"app;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+def record_stage(stage, seconds):
+    metrics = request_metrics.get()
+    if metrics is not None:
+        metrics.record(stage, seconds)
+
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+def set_request_voice(voice):
+    # The voice is caller-supplied; unknown ones share one label so the series stay bounded
+    metrics = request_metrics.get()
+    if metrics is not None:
+        metrics.voice = voice if voice in VOICE_BACKENDS else "invalid"
+
+class MetricsMiddleware:
+    # Plain ASGI so streamed bodies pass straight through; adds Server-Timing to every response
+
+    def __init__(self, app):
+        self.app = app
+        self.routes = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        metrics = RequestMetrics()
+        token = request_metrics.set(metrics)
+        state = {"status": 500, "headers_sent_at": None}
+        HTTP_IN_FLIGHT.inc()
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                state["headers_sent_at"] = time.perf_counter()
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", metrics.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                HTTP_BYTES.inc(len(message.get("body", b"")), route=self._route(scope))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            finished = time.perf_counter()
+            route = self._route(scope)
+            if state["headers_sent_at"] is not None:
+                metrics.record("response_write", finished - state["headers_sent_at"])
+            HTTP_IN_FLIGHT.inc(-1)
+            HTTP_REQUESTS.inc(method=scope["method"], route=route, status=str(state["status"]))
+            HTTP_DURATION.observe(finished - metrics.started, route=route)
+            if metrics.voice:
+                for stage, seconds in metrics.stages.items():
+                    TTS_STAGE_DURATION.observe(seconds, stage=stage, voice=metrics.voice)
+            request_metrics.reset(token)
+
+    def _route(self, scope):
+        # Label by route template so path parameters don't explode cardinality
+        if self.routes is None:
+            self.routes = {getattr(route, "endpoint", None): route.path for route in app.routes}
+        return self.routes.get(scope.get("endpoint"), "unmatched")
+
+app.add_middleware(MetricsMiddleware)
+
+def metrics_text():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    # Point-in-time values owned by other components
+    cache = synthesis_cache.stats()
+    coalescing = upstream_flights.stats()
+    lines += [
+        "# TYPE voicecraft_cache_hits_total counter",
+        f"voicecraft_cache_hits_total {cache['hits']}",
+        "# TYPE voicecraft_cache_disk_hits_total counter",
+        f"voicecraft_cache_disk_hits_total {cache['disk_hits']}",
+        "# TYPE voicecraft_cache_shared_hits_total counter",
+        f"voicecraft_cache_shared_hits_total {cache['shared_hits']}",
+        "# TYPE voicecraft_cache_snapshot_hits_total counter",
+        f"voicecraft_cache_snapshot_hits_total {cache['snapshot_hits']}",
+        "# TYPE voicecraft_cache_misses_total counter",
+        f"voicecraft_cache_misses_total {cache['misses']}",
+        "# TYPE voicecraft_cache_bytes gauge",
+        f"voicecraft_cache_bytes {cache['bytes']}",
+        "# TYPE voicecraft_cache_entries gauge",
+        f"voicecraft_cache_entries {cache['entries']}",
+        "# TYPE voicecraft_coalesced_requests_total counter",
+        f"voicecraft_coalesced_requests_total {coalescing['coalesced']}",
+        "# TYPE voicecraft_syntheses_in_flight gauge",
+        f"voicecraft_syntheses_in_flight {coalescing['in_flight']}",
+        "# TYPE voicecraft_backend_in_flight gauge",
+    ]
+    for backend in synthesis_backends:
+        lines.append(f'voicecraft_backend_in_flight{{backend="{backend.name}"}} {backend.in_flight}')
+    lines.append("# TYPE voicecraft_backend_concurrency_limit gauge")
+    for backend in synthesis_backends:
+        lines.append(f'voicecraft_backend_concurrency_limit{{backend="{backend.name}"}} {backend.queue.limit}')
+    lines.append("# TYPE voicecraft_backend_queued gauge")
+    for backend in synthesis_backends:
+        lines.append(f'voicecraft_backend_queued{{backend="{backend.name}"}} {backend.queue.queued}')
+    lines.append("# TYPE voicecraft_backend_shed_total counter")
+    for backend in synthesis_backends:
+        lines.append(f'voicecraft_backend_shed_total{{backend="{backend.name}"}} {backend.queue.shed}')
+    return "\n".join(lines) + "\n"
+
+# Voices offered by SAPI4 backends (Tetyys and self-hosted containers)
+SAPI4_VOICES = [
     "Adult Female #1, American English (TruVoice)",
     "Adult Female #2, American English (TruVoice)",
     "Adult Male #1, American English (TruVoice)",
@@ -55,9 +356,2718 @@ DEFAULT_VOICE = "Sam"
 DEFAULT_PITCH = 150
 DEFAULT_SPEED = 150
 
-@app.get("/")
-async def root():
-    html_content = """
+# Request limits
+MAX_TEXT_LENGTH = 1000
+MIN_PITCH_SPEED = 50
+MAX_PITCH_SPEED = 250
+
+def error_response(status_code, message):
+    return JSONResponse(
+        content={
+            "status": False,
+            "status_code": status_code,
+            "message": message
+        },
+        status_code=status_code
+    )
+
+def validate_tts_params(voice, text, pitch, speed, max_length=MAX_TEXT_LENGTH):
+    # Returns an error message, or None when the parameters can go to the upstream
+    if not voice or not text or voice.strip() == "" or text.strip() == "":
+        return "Voice and text parameters are required"
+    
+    # Validate text length
+    if len(text) > max_length:
+        return f"Text must be {max_length} characters or less"
+    
+    # Validate voice
+    backends = VOICE_BACKENDS.get(voice)
+    if not backends:
+        return f"Voice '{voice}' is not available. Please use one of the supported voices."
+    
+    # Validate pitch and speed against the ranges of the voice's primary backend
+    (pitch_low, pitch_high), (speed_low, speed_high) = backends[0].pitch_range, backends[0].speed_range
+    if (pitch_low, pitch_high) == (speed_low, speed_high):
+        if not pitch_low <= pitch <= pitch_high or not speed_low <= speed <= speed_high:
+            return f"Pitch and speed must be between {pitch_low} and {pitch_high}"
+    elif not pitch_low <= pitch <= pitch_high:
+        return f"Pitch must be between {pitch_low} and {pitch_high}"
+    elif not speed_low <= speed <= speed_high:
+        return f"Speed must be between {speed_low} and {speed_high}"
+    return None
+
+# Synthesis cache settings
+CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_MAX_ITEM_BYTES = int(os.environ.get("TTS_CACHE_MAX_ITEM_BYTES", str(8 * 1024 * 1024)))
+CACHE_DIR = os.environ.get("TTS_CACHE_DIR", "")
+CACHE_DISK_MAX_BYTES = int(os.environ.get("TTS_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+CACHE_MAX_AGE = int(os.environ.get("TTS_CACHE_MAX_AGE", "86400"))
+# Tier shared by every worker (and, for Redis, every host), with cross-process single-flight locks
+SHARED_CACHE_URL = os.environ.get("TTS_SHARED_CACHE", "")
+SHARED_CACHE_MAX_BYTES = int(os.environ.get("TTS_SHARED_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+SHARED_CACHE_TTL = int(os.environ.get("TTS_SHARED_CACHE_TTL", str(7 * 86400)))
+# Read-only zip bundled with a deployment, so a fresh instance starts with a warm cache
+CACHE_SNAPSHOT = os.environ.get("TTS_CACHE_SNAPSHOT", "")
+SHARED_LOCK_TTL = float(os.environ.get("TTS_SHARED_LOCK_TTL", "60"))
+SHARED_LOCK_POLL = 0.05
+
+def synthesis_key(voice, text, pitch, speed):
+    # SAPI4 output is deterministic, so the parameters fully identify the audio
+    if TEXT_NORMALIZATION:
+        text = fold_case(text)
+    payload = json.dumps([voice, text, pitch, speed], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class CacheSnapshot:
+    # Zip written by write_cache_snapshot: audio under "audio/<key>", precompressed static
+    # assets under "static/<digest>.<encoding>". Only the central directory is read up front
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            self.archive = zipfile.ZipFile(path)
+        except (OSError, zipfile.BadZipFile) as e:
+            logger.warning("Ignoring cache snapshot %r: %s", path, e)
+            self.archive = None
+
+    def read(self, name):
+        if self.archive is None:
+            return None
+        try:
+            return self.archive.read(name)
+        except KeyError:
+            return None
+
+cache_snapshot = CacheSnapshot(CACHE_SNAPSHOT) if CACHE_SNAPSHOT else None
+
+class SynthesisCache:
+    # In-memory LRU bounded by total bytes, backed by an optional read-only snapshot, an optional
+    # on-disk tier and an optional shared store
+
+    def __init__(self, max_bytes, max_item_bytes, directory="", disk_max_bytes=0, shared=None, snapshot=None):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self.shared = shared
+        self.snapshot = snapshot
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.entries = OrderedDict()
+        self.size = 0
+        self.disk_size = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.shared_hits = 0
+        self.shared_waits = 0
+        self.snapshot_hits = 0
+        self.misses = 0
+
+    async def get(self, key):
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+        if self.snapshot:
+            data = await asyncio.to_thread(self.snapshot.read, f"audio/{key}")
+            if data is not None:
+                self.hits += 1
+                self.snapshot_hits += 1
+                self._store_memory(key, data)
+                return data
+        if self.directory:
+            data = await asyncio.to_thread(self._read_disk, key)
+            if data is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self._store_memory(key, data)
+                return data
+        if self.shared:
+            data = await self._get_shared(key)
+            if data is not None:
+                self.hits += 1
+                self.shared_hits += 1
+                self._store_memory(key, data)
+                return data
+        self.misses += 1
+        return None
+
+    async def set(self, key, data):
+        if len(data) > self.max_item_bytes:
+            return
+        self._store_memory(key, data)
+        if self.directory:
+            await asyncio.to_thread(self._write_disk, key, data)
+        if self.shared:
+            try:
+                await self.shared.set(key, data)
+            except Exception as e:
+                logger.warning("Shared cache write failed: %s", e)
+
+    async def claim(self, key):
+        # Cross-process single-flight: returns (audio, False) if another worker produced it while
+        # we waited, (None, True) if we hold the lock and should produce it, (None, False) otherwise
+        if not self.shared:
+            return None, False
+        deadline = time.monotonic() + SHARED_LOCK_TTL
+        waited = False
+        try:
+            while True:
+                if await self.shared.try_lock(key, self.owner, SHARED_LOCK_TTL):
+                    # It may have landed between our miss and taking the lock
+                    data = await self._get_shared(key)
+                    if data is None:
+                        return None, True
+                    await self.shared.unlock(key, self.owner)
+                else:
+                    data = await self._get_shared(key)
+                if data is not None:
+                    self.shared_hits += 1
+                    self.shared_waits += waited
+                    self._store_memory(key, data)
+                    return data, False
+                if time.monotonic() > deadline:
+                    return None, False
+                waited = True
+                await asyncio.sleep(SHARED_LOCK_POLL)
+        except Exception as e:
+            # An unreachable store only costs us the deduplication
+            logger.warning("Shared cache lock failed: %s", e)
+            return None, False
+
+    async def release(self, key):
+        try:
+            await self.shared.unlock(key, self.owner)
+        except Exception as e:
+            logger.warning("Shared cache unlock failed: %s", e)
+
+    async def _get_shared(self, key):
+        try:
+            return await self.shared.get(key)
+        except Exception as e:
+            logger.warning("Shared cache read failed: %s", e)
+            return None
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "disk": bool(self.directory),
+            "shared": self.shared.name if self.shared else None,
+            "shared_hits": self.shared_hits,
+            "shared_waits": self.shared_waits,
+            "snapshot": self.snapshot.path if self.snapshot else None,
+            "snapshot_hits": self.snapshot_hits,
+        }
+
+    def _store_memory(self, key, data):
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self.entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes and self.entries:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Touch so disk eviction approximates LRU
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            return
+        if self.disk_size is None:
+            self.disk_size = sum(size for _, size, _ in self._scan_disk())
+        else:
+            self.disk_size += len(data)
+        if self.disk_max_bytes and self.disk_size > self.disk_max_bytes:
+            self._evict_disk()
+
+    def _scan_disk(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict_disk(self):
+        # Drop least recently used files until we are back under 90% of the budget
+        files = sorted(self._scan_disk(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * 0.9
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self.disk_size = total
+
+class MemorySharedStore:
+    # In-process stand-in for a network store: same interface and semantics, no server needed
+
+    name = "memory"
+
+    def __init__(self):
+        self.entries = {}
+        self.locks = {}
+
+    async def get(self, key):
+        return self.entries.get(key)
+
+    async def set(self, key, data):
+        self.entries[key] = data
+
+    async def try_lock(self, key, owner, ttl):
+        holder = self.locks.get(key)
+        if holder is not None and holder[1] > time.monotonic():
+            return False
+        self.locks[key] = (owner, time.monotonic() + ttl)
+        return True
+
+    async def unlock(self, key, owner):
+        if self.locks.get(key, (None,))[0] == owner:
+            del self.locks[key]
+
+class SQLiteSharedStore:
+    # One database file shared by every worker on the host; reads go through SQLite's mmap
+
+    name = "sqlite"
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.initialized = False
+        self.size = None
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA mmap_size=268435456")
+            if not self.initialized:
+                conn.executescript("""
+                    PRAGMA journal_mode=WAL;
+                    CREATE TABLE IF NOT EXISTS audio (key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL);
+                    CREATE INDEX IF NOT EXISTS audio_by_access ON audio (accessed);
+                    CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL);
+                """)
+                self.initialized = True
+            yield conn
+        finally:
+            conn.close()
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key, data):
+        await asyncio.to_thread(self._set, key, data)
+
+    async def try_lock(self, key, owner, ttl):
+        return await asyncio.to_thread(self._try_lock, key, owner, ttl)
+
+    async def unlock(self, key, owner):
+        await asyncio.to_thread(self._unlock, key, owner)
+
+    def _get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data, accessed FROM audio WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            # Refresh the LRU clock at most once a minute, so hot reads stay read-only
+            if time.time() - row[1] > 60:
+                conn.execute("UPDATE audio SET accessed = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def _set(self, key, data):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO audio (key, data, size, accessed) VALUES (?, ?, ?, ?)", (key, data, len(data), time.time()))
+            if self.size is None:
+                self.size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM audio").fetchone()[0]
+            else:
+                self.size += len(data)
+            if self.max_bytes and self.size > self.max_bytes:
+                # Other workers write too, so recount before trimming back under 90% of the budget
+                self.size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM audio").fetchone()[0]
+                excess = self.size - self.max_bytes * 0.9
+                for stale_key, size in conn.execute("SELECT key, size FROM audio ORDER BY accessed").fetchall():
+                    if excess <= 0:
+                        break
+                    conn.execute("DELETE FROM audio WHERE key = ?", (stale_key,))
+                    excess -= size
+                    self.size -= size
+
+    def _try_lock(self, key, owner, ttl):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM locks WHERE key = ? AND expires < ?", (key, time.time()))
+            claimed = conn.execute("INSERT OR IGNORE INTO locks (key, owner, expires) VALUES (?, ?, ?)", (key, owner, time.time() + ttl)).rowcount == 1
+            conn.execute("COMMIT")
+            return claimed
+
+    def _unlock(self, key, owner):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, owner))
+
+class RedisSharedStore:
+    # Shared across hosts; entries expire after SHARED_CACHE_TTL and Redis' own eviction policy applies
+
+    name = "redis"
+    UNLOCK_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, url, ttl):
+        import redis.asyncio as redis_asyncio
+        self.client = redis_asyncio.from_url(url)
+        self.ttl = ttl
+
+    async def get(self, key):
+        return await self.client.get(f"voicecraft:audio:{key}")
+
+    async def set(self, key, data):
+        await self.client.set(f"voicecraft:audio:{key}", data, ex=self.ttl)
+
+    async def try_lock(self, key, owner, ttl):
+        return bool(await self.client.set(f"voicecraft:lock:{key}", owner, nx=True, px=int(ttl * 1000)))
+
+    async def unlock(self, key, owner):
+        await self.client.eval(self.UNLOCK_SCRIPT, 1, f"voicecraft:lock:{key}", owner)
+
+def open_shared_store(url):
+    # "sqlite:/path/to/cache.sqlite3", "redis://host:6379/0" or "memory"
+    if not url:
+        return None
+    if url.startswith("sqlite:"):
+        return SQLiteSharedStore(url[len("sqlite:"):], SHARED_CACHE_MAX_BYTES)
+    if url.startswith(("redis://", "rediss://")):
+        if not REDIS_AVAILABLE:
+            logger.warning("TTS_SHARED_CACHE points at Redis but the redis package is not installed")
+            return None
+        return RedisSharedStore(url, SHARED_CACHE_TTL)
+    if url == "memory":
+        return MemorySharedStore()
+    logger.warning("Ignoring unrecognised TTS_SHARED_CACHE %r", url)
+    return None
+
+synthesis_cache = SynthesisCache(
+    CACHE_MAX_BYTES, CACHE_MAX_ITEM_BYTES, CACHE_DIR, CACHE_DISK_MAX_BYTES, open_shared_store(SHARED_CACHE_URL), cache_snapshot,
+)
+
+def variant_key(key, audio_format, processing=None):
+    # Raw upstream WAV lives under the synthesis key itself, processed audio and encodings next to it
+    if processing:
+        key = f"{key}-{processing}"
+    return key if audio_format == "wav" else f"{key}-{audio_format}"
+
+def audio_headers(key, voice, pitch, speed, audio_format="wav"):
+    return {
+        "Content-Disposition": f"inline; filename=voicecraft-audio.{AUDIO_FORMATS[audio_format][1]}",
+        "X-Generated-By": "VoiceCraft Pro",
+        "X-Voice-Used": voice,
+        "X-Pitch": str(pitch),
+        "X-Speed": str(speed),
+        "ETag": f'"{key}"',
+        "Cache-Control": f"public, max-age={CACHE_MAX_AGE}",
+    }
+
+def etag_matches(if_none_match, key):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return f'"{key}"' in tags
+
+RANGE_SPEC = re.compile(r"\s*(\d*)\s*-\s*(\d*)\s*", re.ASCII)
+
+def ranged_response(request, body, media_type, headers):
+    # Serves a single byte range of a fully known body; anything else falls back to the whole body
+    headers = {**headers, "Accept-Ranges": "bytes"}
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if not range_header or (if_range and if_range.strip() != headers.get("ETag")):
+        return Response(content=body, media_type=media_type, headers=headers)
+    units, _, spec = range_header.partition("=")
+    if units.strip().lower() != "bytes" or "," in spec:
+        return Response(content=body, media_type=media_type, headers=headers)
+    size = len(body)
+    match = RANGE_SPEC.fullmatch(spec)
+    # Malformed or backwards specs are ignored rather than refused
+    if not match or not any(match.groups()):
+        return Response(content=body, media_type=media_type, headers=headers)
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        return Response(content=body, media_type=media_type, headers=headers)
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the final N bytes; a zero-length suffix can never be satisfied
+        start, end = (max(0, size - int(last)), size - 1) if int(last) > 0 else (size, size - 1)
+    if start >= size:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content=body[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+
+class UpstreamError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+class AudioBroadcast:
+    # One upstream body relayed to any number of readers as chunks arrive
+
+    def __init__(self):
+        self.started = asyncio.get_running_loop().create_future()
+        self.waiter = asyncio.get_running_loop().create_future()
+        self.content_length = None
+        self.chunks = []
+        self.size = 0
+        self.done = False
+        self.error = None
+
+    def start(self, content_length=None):
+        self.content_length = content_length
+        if not self.started.done():
+            self.started.set_result(None)
+
+    def publish(self, chunk):
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        self._wake()
+
+    def finish(self):
+        self.done = True
+        self._wake()
+
+    def fail(self, error):
+        # Before start() the error reaches every waiter; afterwards it aborts their streams
+        self.error = error
+        if not self.started.done():
+            self.started.set_exception(error)
+            self.started.exception()
+        self._wake()
+
+    def body(self):
+        return b"".join(self.chunks)
+
+    async def wait_started(self):
+        await asyncio.shield(self.started)
+
+    async def iter_chunks(self):
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.error is not None:
+                raise self.error
+            if self.done:
+                return
+            await asyncio.shield(self.waiter)
+
+    def _wake(self):
+        waiter = self.waiter
+        self.waiter = asyncio.get_running_loop().create_future()
+        waiter.set_result(None)
+
+class SingleFlight:
+    # Concurrent callers for the same key share one in-flight stream, including its error
+
+    def __init__(self):
+        self.calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def open(self, key, producer):
+        broadcast = self.calls.get(key)
+        if broadcast is None:
+            broadcast = AudioBroadcast()
+            self.calls[key] = broadcast
+            # Run as a task so a disconnecting leader doesn't cut off the other readers
+            task = asyncio.ensure_future(producer(broadcast))
+            task.add_done_callback(lambda done: self._finish(key, broadcast, done))
+            self.leaders += 1
+            shared = False
+        else:
+            self.coalesced += 1
+            shared = True
+        await broadcast.wait_started()
+        return broadcast, shared
+
+    def stats(self):
+        return {
+            "in_flight": len(self.calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
+
+    def _finish(self, key, broadcast, task):
+        if self.calls.get(key) is broadcast:
+            del self.calls[key]
+        if broadcast.done or broadcast.error is not None:
+            return
+        if task.cancelled():
+            broadcast.fail(UpstreamError(500, "Error generating speech: cancelled"))
+        elif isinstance(task.exception(), UpstreamError):
+            broadcast.fail(task.exception())
+        elif task.exception() is not None:
+            broadcast.fail(UpstreamError(500, f"Error generating speech: {str(task.exception())}"))
+
+upstream_flights = SingleFlight()
+
+# Upstream resilience settings
+BREAKER_WINDOW = float(os.environ.get("UPSTREAM_BREAKER_WINDOW", "10"))
+BREAKER_MIN_REQUESTS = int(os.environ.get("UPSTREAM_BREAKER_MIN_REQUESTS", "10"))
+BREAKER_ERROR_RATE = float(os.environ.get("UPSTREAM_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN = float(os.environ.get("UPSTREAM_BREAKER_COOLDOWN", "15"))
+UPSTREAM_MAX_RETRIES = int(os.environ.get("UPSTREAM_MAX_RETRIES", "2"))
+RETRY_BUDGET_RATIO = float(os.environ.get("UPSTREAM_RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MIN = int(os.environ.get("UPSTREAM_RETRY_BUDGET_MIN", "10"))
+RETRY_BACKOFF_BASE = float(os.environ.get("UPSTREAM_RETRY_BACKOFF_BASE", "0.1"))
+RETRY_BACKOFF_MAX = float(os.environ.get("UPSTREAM_RETRY_BACKOFF_MAX", "2.0"))
+UPSTREAM_HEDGE = os.environ.get("UPSTREAM_HEDGE", "0") == "1"
+HEDGE_MIN_DELAY = float(os.environ.get("UPSTREAM_HEDGE_MIN_DELAY", "0.5"))
+HEDGE_MIN_SAMPLES = 20
+UPSTREAM_ADAPTIVE = os.environ.get("UPSTREAM_ADAPTIVE", "1") == "1"
+UPSTREAM_MIN_CONCURRENCY = int(os.environ.get("UPSTREAM_MIN_CONCURRENCY", "2"))
+UPSTREAM_INITIAL_CONCURRENCY = int(os.environ.get("UPSTREAM_INITIAL_CONCURRENCY", "8"))
+UPSTREAM_LATENCY_TOLERANCE = float(os.environ.get("UPSTREAM_LATENCY_TOLERANCE", "2.0"))
+UPSTREAM_QUEUE_SIZE = int(os.environ.get("UPSTREAM_QUEUE_SIZE", "100"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", "10"))
+
+class CircuitBreaker:
+    # Opens when the recent error rate spikes, then lets a single probe through after a cooldown
+
+    def __init__(self, window, min_requests, error_rate, cooldown):
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.outcomes = deque()
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+
+    def allow(self):
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown:
+                self.rejected += 1
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.probing:
+                self.rejected += 1
+                return False
+            self.probing = True
+        return True
+
+    def record_success(self):
+        if self.state == "half_open":
+            self.state = "closed"
+            self.probing = False
+            self.outcomes.clear()
+        self._record(True)
+
+    def record_failure(self):
+        if self.state == "half_open":
+            self._open()
+            return
+        self._record(False)
+        failures = sum(1 for _, ok in self.outcomes if not ok)
+        if len(self.outcomes) >= self.min_requests and failures / len(self.outcomes) >= self.error_rate:
+            self._open()
+
+    def stats(self):
+        return {"state": self.state, "recent_requests": len(self.outcomes), "rejected": self.rejected}
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.probing = False
+        self.outcomes.clear()
+
+    def _record(self, ok):
+        now = time.monotonic()
+        self.outcomes.append((now, ok))
+        while self.outcomes and self.outcomes[0][0] < now - self.window:
+            self.outcomes.popleft()
+
+class RetryBudget:
+    # Retries and hedges may add at most `ratio` extra load on top of a small floor per window
+
+    def __init__(self, window, ratio, minimum):
+        self.window = window
+        self.ratio = ratio
+        self.minimum = minimum
+        self.requests = deque()
+        self.spent = deque()
+        self.retries = 0
+        self.hedges = 0
+        self.exhausted = 0
+
+    def record_request(self):
+        self.requests.append(time.monotonic())
+
+    def try_spend(self):
+        now = time.monotonic()
+        for events in (self.requests, self.spent):
+            while events and events[0] < now - self.window:
+                events.popleft()
+        if len(self.spent) >= self.minimum + self.ratio * len(self.requests):
+            self.exhausted += 1
+            return False
+        self.spent.append(now)
+        return True
+
+    def stats(self):
+        return {"retries": self.retries, "hedges": self.hedges, "exhausted": self.exhausted}
+
+class LatencyWindow:
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, pct):
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def retryable(error):
+    return error.status_code in (408, 429) or error.status_code >= 500
+
+# Per-client rate limiting and fair scheduling
+RATE_LIMIT_RATE = float(os.environ.get("RATE_LIMIT_RATE", "0"))
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", "20"))
+RATE_LIMIT_DB = os.environ.get("RATE_LIMIT_DB", "")
+# Number of reverse proxies in front of the app; each appends the address it saw to X-Forwarded-For
+RATE_LIMIT_TRUST_PROXY = int(os.environ.get("RATE_LIMIT_TRUST_PROXY", "0"))
+RATE_LIMIT_MAX_CLIENTS = 100000
+# "key:weight,key" - known API keys get their own bucket and a larger share of upstream slots
+API_KEY_WEIGHTS = {}
+for api_key_entry in os.environ.get("RATE_LIMIT_API_KEYS", "").split(","):
+    api_key, _, api_key_weight = api_key_entry.strip().partition(":")
+    if api_key:
+        API_KEY_WEIGHTS[api_key] = float(api_key_weight or "1")
+
+# (client id, weight) for the request being served, inherited by the syntheses it starts
+request_client = contextvars.ContextVar("request_client", default=("anonymous", 1.0))
+
+class MemoryRateLimitStore:
+    # Token buckets for this process; least recently seen clients are dropped past the cap
+
+    def __init__(self, max_clients=RATE_LIMIT_MAX_CLIENTS):
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()
+
+    async def take(self, client, cost, rate, burst):
+        # Returns 0 if the tokens were taken, else seconds until they will be available
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(client, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        retry_after = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / rate
+        self.buckets[client] = (tokens, now)
+        if len(self.buckets) > self.max_clients:
+            self.buckets.popitem(last=False)
+        return retry_after
+
+class SQLiteRateLimitStore:
+    # Buckets shared by every worker process pointed at the same database file
+
+    def __init__(self, path):
+        self.path = path
+        self.initialized = False
+
+    async def take(self, client, cost, rate, burst):
+        return await asyncio.to_thread(self._take, client, cost, rate, burst, time.time())
+
+    def _take(self, client, cost, rate, burst, now):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            if not self.initialized:
+                conn.executescript("""
+                    PRAGMA journal_mode=WAL;
+                    CREATE TABLE IF NOT EXISTS buckets (client TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);
+                """)
+                self.initialized = True
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE client = ?", (client,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            retry_after = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                retry_after = (cost - tokens) / rate
+            conn.execute("INSERT OR REPLACE INTO buckets (client, tokens, updated) VALUES (?, ?, ?)", (client, tokens, now))
+            conn.execute("COMMIT")
+            return retry_after
+        finally:
+            conn.close()
+
+class RateLimiter:
+    def __init__(self, store, rate, burst):
+        self.store = store
+        self.rate = rate
+        self.burst = burst
+        self.allowed = 0
+        self.rejected = 0
+
+    def identify(self, request):
+        api_key = request.headers.get("x-api-key", "")
+        authorization = request.headers.get("authorization", "")
+        if not api_key and authorization.lower().startswith("bearer "):
+            api_key = authorization[7:].strip()
+        # Unknown keys fall back to the address, so minting keys doesn't mint quota
+        if api_key in API_KEY_WEIGHTS:
+            return f"key:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]}", API_KEY_WEIGHTS[api_key]
+        address = request.client.host if request.client else "unknown"
+        forwarded = request.headers.get("x-forwarded-for")
+        if RATE_LIMIT_TRUST_PROXY and forwarded:
+            # Entries left of the ones our proxies appended are whatever the client chose to send
+            entries = [entry.strip() for entry in forwarded.split(",")]
+            address = entries[max(0, len(entries) - RATE_LIMIT_TRUST_PROXY)] or address
+        return f"ip:{address}", 1.0
+
+    async def check(self, connection, cost=1):
+        # Returns 0 if admitted, else seconds until the client may retry
+        client, weight = self.identify(connection)
+        request_client.set((client, weight))
+        if self.rate <= 0:
+            return 0.0
+        try:
+            retry_after = await self.store.take(client, cost, self.rate * weight, max(self.burst * weight, cost))
+        except sqlite3.Error as e:
+            # Fail open; a broken shared store shouldn't take the API down with it
+            logger.warning("Rate limit store unavailable: %s", e)
+            return 0.0
+        if retry_after:
+            self.rejected += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+    async def admit(self, request, cost=1):
+        # Returns None if admitted, else a 429 response
+        retry_after = await self.check(request, cost)
+        if not retry_after:
+            return None
+        response = error_response(429, "Too many requests. Please slow down.")
+        response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def stats(self):
+        return {
+            "enabled": self.rate > 0,
+            "store": type(self.store).__name__,
+            "rate": self.rate,
+            "burst": self.burst,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
+
+rate_limiter = RateLimiter(
+    SQLiteRateLimitStore(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryRateLimitStore(),
+    RATE_LIMIT_RATE,
+    RATE_LIMIT_BURST,
+)
+
+class FairQueue:
+    # Concurrency slots handed out by weighted fair queuing (start-time tags), so one
+    # busy client queues behind its own requests instead of everyone else's
+
+    def __init__(self, limit, max_queued=UPSTREAM_QUEUE_SIZE, timeout=UPSTREAM_QUEUE_TIMEOUT):
+        self.limit = limit
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.active = 0
+        self.queued = 0
+        self.shed = 0
+        self.waiters = []
+        self.sequence = 0
+        self.virtual_time = 0.0
+        self.finish_tags = {}
+
+    @asynccontextmanager
+    async def slot(self, client, weight=1.0):
+        await self.acquire(client, weight)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, client, weight=1.0):
+        if self.active < self.limit and not self.queued:
+            self.active += 1
+            return
+        # Refuse up front rather than let a backlog turn into timeouts for everyone
+        if self.queued >= self.max_queued:
+            self.shed += 1
+            raise UpstreamError(503, "TTS service is busy. Please try again shortly.")
+        tag = max(self.virtual_time, self.finish_tags.get(client, 0.0)) + 1.0 / weight
+        self.finish_tags[client] = tag
+        self.sequence += 1
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (tag, self.sequence, waiter))
+        self.queued += 1
+        try:
+            done, _ = await asyncio.wait({waiter}, timeout=self.timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if not done:
+            self._abandon(waiter)
+            self.shed += 1
+            raise UpstreamError(503, "TTS service is busy. Please try again shortly.")
+
+    def _abandon(self, waiter):
+        if waiter.done():
+            # The slot was handed over just as we gave up; pass it on
+            self.release()
+        else:
+            waiter.cancel()
+            self.queued -= 1
+
+    def _wake(self):
+        while self.waiters and self.active < self.limit:
+            tag, _, waiter = heapq.heappop(self.waiters)
+            if not waiter.done():
+                self.virtual_time = tag
+                self.queued -= 1
+                self.active += 1
+                waiter.set_result(None)
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+        if not self.active and not self.queued:
+            # Idle: forget per-client history so the tag table doesn't grow without bound
+            self.waiters.clear()
+            self.finish_tags.clear()
+            self.virtual_time = 0.0
+
+    def resize(self, limit):
+        self.limit = limit
+        self._wake()
+
+class AdaptiveLimit:
+    # AIMD on upstream round trips: grow by about one slot per limit's worth of calls that
+    # come back near the best recent latency, shrink by a fraction on slow calls or errors
+
+    def __init__(self, queue, initial, min_limit, max_limit, tolerance=UPSTREAM_LATENCY_TOLERANCE, backoff=0.9):
+        self.queue = queue
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.samples = deque(maxlen=100)
+        self.last_decrease = 0.0
+        queue.resize(initial)
+
+    def observe(self, seconds, dropped=False):
+        if not dropped:
+            self.samples.append(seconds)
+        baseline = min(self.samples) if self.samples else None
+        if dropped or (baseline is not None and seconds > baseline * self.tolerance):
+            # One cut per round trip, so a burst of failures from the same moment counts once
+            now = time.monotonic()
+            if now - self.last_decrease >= max(seconds, baseline or 0.0):
+                self.last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif self.queue.active >= self.limit / 2:
+            # Only probe upwards while the current limit is actually being used
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        self.queue.resize(int(self.limit))
+
+    def stats(self):
+        return {
+            "limit": int(self.limit),
+            "baseline_ms": round(min(self.samples) * 1000, 1) if self.samples else None,
+        }
+
+class SynthesisBackend:
+    # An engine serving a set of voices; subclasses implement _stream() as an async context manager
+
+    def __init__(self, name, voices, concurrency, pitch_range=None, speed_range=None):
+        self.name = name
+        self.voices = list(voices)
+        self.concurrency = concurrency
+        self.pitch_range = pitch_range or (MIN_PITCH_SPEED, MAX_PITCH_SPEED)
+        self.speed_range = speed_range or (MIN_PITCH_SPEED, MAX_PITCH_SPEED)
+        self.queue = FairQueue(concurrency)
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+
+    @asynccontextmanager
+    async def stream(self, voice, text, pitch, speed):
+        # Yields (content length, chunk iterator) while holding one of the backend's slots
+        async with self.queue.slot(*request_client.get()):
+            self.in_flight += 1
+            self.requests += 1
+            try:
+                async with self._stream(voice, text, pitch, speed) as opened:
+                    yield opened
+            except UpstreamError:
+                self.failures += 1
+                raise
+            finally:
+                self.in_flight -= 1
+
+    def _stream(self, voice, text, pitch, speed):
+        raise NotImplementedError
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "voices": len(self.voices),
+            "concurrency": self.queue.limit,
+            "in_flight": self.in_flight,
+            "queued": self.queue.queued,
+            "shed": self.queue.shed,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+class SAPI4Backend(SynthesisBackend):
+    # Tetyys or a self-hosted container speaking the same /SAPI4/SAPI4 protocol
+
+    def __init__(self, name, url, voices, concurrency):
+        super().__init__(name, voices, concurrency)
+        self.url = url
+        self.breaker = CircuitBreaker(BREAKER_WINDOW, BREAKER_MIN_REQUESTS, BREAKER_ERROR_RATE, BREAKER_COOLDOWN)
+        self.retry_budget = RetryBudget(10.0, RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN)
+        self.latency = LatencyWindow()
+        # UPSTREAM_CONCURRENCY becomes the ceiling the limit may grow to
+        self.adaptive = None
+        if UPSTREAM_ADAPTIVE:
+            initial = max(UPSTREAM_MIN_CONCURRENCY, min(concurrency, UPSTREAM_INITIAL_CONCURRENCY))
+            self.adaptive = AdaptiveLimit(self.queue, initial, UPSTREAM_MIN_CONCURRENCY, concurrency)
+
+    @asynccontextmanager
+    async def _stream(self, voice, text, pitch, speed):
+        response = await self.open_upstream({"text": text, "voice": voice, "pitch": pitch, "speed": speed})
+        try:
+            # aiter_bytes() decodes any transfer compression, so the length only holds for identity bodies
+            content_length = None
+            if "content-encoding" not in response.headers:
+                content_length = response.headers.get("content-length")
+            yield content_length, self._iter_body(response)
+        finally:
+            await response.aclose()
+
+    async def _iter_body(self, response):
+        try:
+            async for chunk in response.aiter_bytes():
+                yield chunk
+        except httpx.TimeoutException:
+            self.breaker.record_failure()
+            raise UpstreamError(408, "TTS service timeout")
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            raise UpstreamError(500, f"Error generating speech: {str(e)}")
+
+    async def send_upstream(self, params):
+        # Returns a streamed response once its headers are in
+        client = get_upstream_client()
+        started = time.monotonic()
+        try:
+            # Make request to the SAPI4 service over the shared connection pool
+            request = client.build_request("GET", self.url, params=params)
+            response = await client.send(request, stream=True)
+        except httpx.TimeoutException:
+            UPSTREAM_RESPONSES.inc(backend=self.name, status="timeout")
+            self.observe_round_trip(time.monotonic() - started, dropped=True)
+            raise UpstreamError(408, "TTS service timeout")
+        except Exception as e:
+            UPSTREAM_RESPONSES.inc(backend=self.name, status="error")
+            self.observe_round_trip(time.monotonic() - started, dropped=True)
+            raise UpstreamError(500, f"Error generating speech: {str(e)}")
+        UPSTREAM_RESPONSES.inc(backend=self.name, status=str(response.status_code))
+        self.latency.observe(time.monotonic() - started)
+        self.observe_round_trip(time.monotonic() - started, dropped=response.status_code == 429 or response.status_code >= 500)
+        return response
+
+    def observe_round_trip(self, seconds, dropped):
+        if self.adaptive is not None:
+            self.adaptive.observe(seconds, dropped)
+
+    async def send_hedged(self, params):
+        # After a p95-sized delay, race a second request against the first
+        delay = self.latency.percentile(95) if UPSTREAM_HEDGE else None
+        first = asyncio.ensure_future(self.send_upstream(params))
+        if delay is None:
+            return await first
+        done, _ = await asyncio.wait({first}, timeout=max(delay, HEDGE_MIN_DELAY))
+        if done or not self.retry_budget.try_spend():
+            return await first
+        self.retry_budget.hedges += 1
+        pending = {first, asyncio.ensure_future(self.send_upstream(params))}
+        outcomes = []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                outcomes.extend(task.exception() or task.result() for task in done)
+                if any(is_ok_response(outcome) for outcome in outcomes):
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(close_abandoned_response)
+        # Prefer a 200 from either request, otherwise report whichever failed first
+        winner = next((outcome for outcome in outcomes if is_ok_response(outcome)), outcomes[0])
+        for outcome in outcomes:
+            if outcome is not winner and isinstance(outcome, httpx.Response):
+                await outcome.aclose()
+        if isinstance(winner, Exception):
+            raise winner
+        return winner
+
+    async def open_upstream(self, params):
+        # Returns a streamed 200 response, retrying transient failures within the retry budget
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise UpstreamError(503, "TTS service is temporarily unavailable")
+            try:
+                response = await self.send_hedged(params)
+            except UpstreamError as e:
+                error = e
+            else:
+                if response.status_code == 200:
+                    self.breaker.record_success()
+                    return response
+                await response.aclose()
+                error = UpstreamError(response.status_code, f"TTS service returned error: {response.status_code}")
+            if not retryable(error):
+                # The upstream answered; a 4xx says nothing about its health
+                self.breaker.record_success()
+                raise error
+            self.breaker.record_failure()
+            if attempt >= UPSTREAM_MAX_RETRIES or not self.retry_budget.try_spend():
+                raise error
+            attempt += 1
+            self.retry_budget.retries += 1
+            # Full jitter keeps retries from a burst of failures from arriving in lockstep
+            await asyncio.sleep(random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt)))
+
+    def stats(self):
+        stats = {**super().stats(), "breaker": self.breaker.stats(), **self.retry_budget.stats()}
+        if self.adaptive is not None:
+            stats["adaptive"] = self.adaptive.stats()
+        return stats
+
+def is_ok_response(outcome):
+    return isinstance(outcome, httpx.Response) and outcome.status_code == 200
+
+def close_abandoned_response(task):
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(task.result().aclose())
+
+class EspeakBackend(SynthesisBackend):
+    # Local espeak-ng engine; pitch and speed use the SAPI4 scale and are mapped onto espeak's
+
+    VOICES = {
+        "eSpeak English (US)": "en-us",
+        "eSpeak English (UK)": "en-gb",
+        "eSpeak French": "fr",
+        "eSpeak German": "de",
+        "eSpeak Spanish": "es",
+    }
+
+    def __init__(self, executable, concurrency):
+        super().__init__("espeak", self.VOICES, concurrency)
+        self.executable = executable
+
+    @asynccontextmanager
+    async def _stream(self, voice, text, pitch, speed):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                self.executable, "--stdout",
+                "-v", self.VOICES[voice],
+                "-p", str(round((pitch - 50) * 99 / 200)),
+                "-s", str(round(speed * 175 / 150)),
+                "--", text,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except OSError as e:
+            raise UpstreamError(500, f"Error generating speech: {str(e)}")
+        try:
+            first = await process.stdout.read(64 * 1024)
+            if not first:
+                await process.wait()
+                raise UpstreamError(500, f"espeak-ng exited with status {process.returncode}")
+            yield None, self._iter_stdout(process, first)
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    async def _iter_stdout(self, process, first):
+        yield first
+        while True:
+            data = await process.stdout.read(64 * 1024)
+            if not data:
+                break
+            yield data
+        if await process.wait() != 0:
+            raise UpstreamError(500, f"espeak-ng exited with status {process.returncode}")
+
+class FakeBackend(SynthesisBackend):
+    # Deterministic tones for load tests: same parameters, same bytes, no network
+
+    SAMPLE_RATE = 11025
+
+    def __init__(self, voices, latency):
+        super().__init__("fake", voices, concurrency=1000)
+        self.latency = latency
+
+    @asynccontextmanager
+    async def _stream(self, voice, text, pitch, speed):
+        await asyncio.sleep(self.latency)
+        data = self.render(voice, text, pitch, speed)
+        yield len(data), iter_bytes(data)
+
+    def render(self, voice, text, pitch, speed):
+        digest = hashlib.sha256(f"{voice}\0{text}".encode("utf-8")).digest()
+        frequency = (200 + digest[0]) * pitch / 150
+        seconds = max(0.2, len(text) * 0.06 * 150 / speed)
+        period = array("h", (
+            int(6000 * math.sin(2 * math.pi * i * frequency / self.SAMPLE_RATE))
+            for i in range(max(2, int(self.SAMPLE_RATE / frequency)))
+        )).tobytes()
+        frames = int(self.SAMPLE_RATE * seconds)
+        pcm = (period * (frames * 2 // len(period) + 1))[:frames * 2]
+        fmt = struct.pack("<HHIIHH", 1, 1, self.SAMPLE_RATE, self.SAMPLE_RATE * 2, 2, 16)
+        return wav_header(fmt, len(pcm)) + pcm
+
+def build_backends(names):
+    backends = []
+    for name in names:
+        if name == "tetyys":
+            backends.append(SAPI4Backend("tetyys", TETYYS_URL, SAPI4_VOICES, UPSTREAM_CONCURRENCY))
+        elif name == "sapi4-local" and SAPI4_LOCAL_URL:
+            backends.append(SAPI4Backend("sapi4-local", SAPI4_LOCAL_URL, SAPI4_VOICES, SAPI4_LOCAL_CONCURRENCY))
+        elif name == "espeak" and shutil.which(ESPEAK_PATH):
+            backends.append(EspeakBackend(shutil.which(ESPEAK_PATH), ESPEAK_CONCURRENCY))
+        elif name == "fake":
+            backends.append(FakeBackend(SAPI4_VOICES, FAKE_LATENCY))
+        else:
+            logger.warning("Skipping unknown or unavailable backend %r", name)
+    return backends
+
+synthesis_backends = build_backends(name.strip() for name in TTS_BACKENDS.split(",") if name.strip())
+
+# Voice -> backends serving it, in routing (failover) order
+VOICE_BACKENDS = {}
+for backend in synthesis_backends:
+    for backend_voice in backend.voices:
+        VOICE_BACKENDS.setdefault(backend_voice, []).append(backend)
+AVAILABLE_VOICES = list(VOICE_BACKENDS)
+
+# Voice catalog: per-voice metadata and every accepted spelling of each name
+SAPI4_VOICE_PATTERNS = [
+    (re.compile(r"^Adult (Female|Male) #(\d+), American English \(TruVoice\)$"), lambda m: {"family": "TruVoice", "gender": m.group(1).lower()}),
+    (re.compile(r"^(Female|Male) Whisper$"), lambda m: {"family": "Whisper", "gender": m.group(1).lower(), "effect": "whisper"}),
+    (re.compile(r"^(Mary|Mike)(?: \(for (Telephone)\)| in (Hall|Space|Stadium))?$"), lambda m: {
+        "family": m.group(1),
+        "gender": "female" if m.group(1) == "Mary" else "male",
+        "effect": (m.group(2) or m.group(3) or "").lower() or None,
+    }),
+    (re.compile(r"^RoboSoft \w+$"), lambda m: {"family": "RoboSoft", "effect": "robotic"}),
+    (re.compile(r"^(Sam|Bonzi)$"), lambda m: {"family": m.group(1), "gender": "male"}),
+]
+ESPEAK_LANGUAGES = {"en-us": "en-US", "en-gb": "en-GB"}
+EXTRA_VOICE_ALIASES = {"Sam": ["Microsoft Sam"], "Mary": ["Microsoft Mary"], "Mike": ["Microsoft Mike"], "Bonzi": ["BonziBuddy"]}
+
+def alias_key(name):
+    # Case, spacing and punctuation don't distinguish voices: "mary-in-hall" == "Mary in Hall"
+    return re.sub(r"[^0-9a-z]", "", name.casefold())
+
+def describe_voice(voice, backends):
+    primary = backends[0]
+    entry = {
+        "name": voice,
+        "id": re.sub(r"[^0-9a-z]+", "-", voice.casefold()).strip("-"),
+        "engine": "sapi4",
+        "family": None,
+        "language": "en-US",
+        "gender": None,
+        "effect": None,
+        "pitch_range": list(primary.pitch_range),
+        "speed_range": list(primary.speed_range),
+        "backends": [backend.name for backend in backends],
+    }
+    aliases = list(EXTRA_VOICE_ALIASES.get(voice, []))
+    if voice in EspeakBackend.VOICES:
+        code = EspeakBackend.VOICES[voice]
+        entry.update(engine="espeak-ng", family="eSpeak", language=ESPEAK_LANGUAGES.get(code, code))
+        aliases.append(f"espeak {code}")
+    for pattern, describe in SAPI4_VOICE_PATTERNS:
+        match = pattern.match(voice)
+        if match:
+            entry.update(describe(match))
+            if entry["family"] == "TruVoice":
+                aliases += [f"Adult {match.group(1)} {match.group(2)}", f"TruVoice {match.group(1)} {match.group(2)}"]
+            break
+    entry["aliases"] = aliases
+    return entry
+
+class VoiceCatalog:
+    def __init__(self, voice_backends):
+        self.entries = [describe_voice(voice, backends) for voice, backends in voice_backends.items()]
+        self.names = [entry["name"] for entry in self.entries]
+        self.by_name = {entry["name"]: entry for entry in self.entries}
+        self.aliases = {}
+        for entry in self.entries:
+            for alias in [entry["name"], entry["id"], *entry["aliases"]]:
+                self.aliases.setdefault(alias_key(alias), entry["name"])
+
+    def resolve(self, voice):
+        # Canonical name for any accepted spelling; unknown voices come back unchanged for validation to reject
+        if voice in self.by_name:
+            return voice
+        return self.aliases.get(alias_key(voice or ""), voice)
+
+    def filter(self, engine="", family="", language="", effect="", gender="", q=""):
+        matches = self.entries
+        for field, wanted in (("engine", engine), ("family", family), ("gender", gender)):
+            if wanted:
+                matches = [entry for entry in matches if (entry[field] or "").casefold() == wanted.casefold()]
+        if language:
+            # "en" matches every English variant
+            wanted = language.casefold()
+            matches = [entry for entry in matches if entry["language"].casefold() == wanted or entry["language"].casefold().startswith(wanted + "-")]
+        if effect:
+            matches = [entry for entry in matches if (entry["effect"] or "none") == effect.casefold()]
+        if q:
+            needle = alias_key(q)
+            matches = [entry for entry in matches if any(needle in alias_key(alias) for alias in [entry["name"], *entry["aliases"]])]
+        return matches
+
+    def body(self, entries, **extra):
+        return {
+            "status": True,
+            "status_code": 200,
+            "voices": [entry["name"] for entry in entries],
+            "catalog": entries,
+            "total_voices": len(entries),
+            "default_voice": DEFAULT_VOICE,
+            "default_pitch": DEFAULT_PITCH,
+            "default_speed": DEFAULT_SPEED,
+            **extra
+        }
+
+voice_catalog = VoiceCatalog(VOICE_BACKENDS)
+VOICE_CATALOG_JSON = json.dumps(voice_catalog.entries, ensure_ascii=False, separators=(",", ":"))
+VOICES_PAGE_MAX = 100
+
+def resolve_voice(voice):
+    return voice_catalog.resolve(voice)
+
+async def stream_from_backends(broadcast, voice, text, pitch, speed):
+    error = UpstreamError(400, f"Voice '{voice}' is not available. Please use one of the supported voices.")
+    for backend in VOICE_BACKENDS.get(voice, []):
+        started = time.perf_counter()
+        try:
+            async with backend.stream(voice, text, pitch, speed) as (content_length, chunks):
+                record_stage("upstream_connect", time.perf_counter() - started)
+                broadcast.start(content_length)
+                with timed("upstream_transfer"):
+                    async for chunk in chunks:
+                        broadcast.publish(chunk)
+        except UpstreamError as e:
+            # Once audio has started flowing there is nothing to fail over to
+            if broadcast.started.done() or not retryable(e):
+                broadcast.fail(e)
+                return
+            error = e
+            continue
+        broadcast.finish()
+        return
+    broadcast.fail(error)
+
+async def iter_bytes(data, chunk_size=64 * 1024):
+    for offset in range(0, len(data), chunk_size):
+        yield data[offset:offset + chunk_size]
+
+async def open_synthesis(voice, text, pitch, speed, key=None, audio_format="wav", segments=None, processing=None):
+    # Returns (chunk iterator, content length, cache status); upstream errors raise before any chunk.
+    # With more than one segment, a miss is assembled from per-segment syntheses
+    key = key or synthesis_key(voice, text, pitch, speed)
+    variant = variant_key(key, audio_format, processing)
+    with timed("cache"):
+        audio_content = await synthesis_cache.get(variant)
+    if audio_content is not None:
+        return iter_bytes(audio_content), len(audio_content), "HIT"
+
+    async def produce(broadcast):
+        # Another worker may already be synthesizing this clip; if so, wait for theirs
+        audio_content, claimed = await synthesis_cache.claim(variant)
+        if audio_content is not None:
+            broadcast.start(len(audio_content))
+            broadcast.publish(audio_content)
+            broadcast.finish()
+            return
+        try:
+            await produce_locally(broadcast)
+        finally:
+            if claimed:
+                await synthesis_cache.release(variant)
+
+    async def produce_locally(broadcast):
+        if audio_format == "wav" and processing:
+            # Processing needs the whole clip, and sits on top of the cached/coalesced raw WAV
+            chunks, _, _ = await open_synthesis(voice, text, pitch, speed, key, segments=segments)
+            audio_content = b"".join([chunk async for chunk in chunks])
+            with timed("postprocess"):
+                try:
+                    audio_content = await asyncio.to_thread(process_wav, audio_content, processing)
+                except ValueError as e:
+                    raise UpstreamError(502, f"TTS service returned audio that can't be processed: {str(e)}")
+            broadcast.start(len(audio_content))
+            broadcast.publish(audio_content)
+            broadcast.finish()
+        elif audio_format == "wav" and segments and len(segments) > 1:
+            await stream_segments(broadcast, voice, segments, pitch, speed)
+        elif audio_format == "wav":
+            await stream_from_backends(broadcast, voice, text, pitch, speed)
+        else:
+            # Transcoded variants sit on top of the cached/coalesced (processed) WAV
+            chunks, _, _ = await open_synthesis(voice, text, pitch, speed, key, segments=segments, processing=processing)
+            broadcast.start()
+            async for chunk in ENCODERS[audio_format](chunks):
+                broadcast.publish(chunk)
+            broadcast.finish()
+        if broadcast.done:
+            body = broadcast.body()
+            if is_spliced(audio_format, segments, processing):
+                # Spliced audio streamed out with a placeholder length; cache it with the real one
+                body = seal_wav(body)
+            await synthesis_cache.set(variant, body)
+
+    broadcast, shared = await upstream_flights.open(variant, produce)
+    return broadcast.iter_chunks(), broadcast.content_length, "COALESCED" if shared else "MISS"
+
+def is_spliced(audio_format, segments, processing):
+    # Whether a miss streams a WAV assembled from segments under a placeholder header
+    return audio_format == "wav" and not processing and bool(segments) and len(segments) > 1
+
+def seal_wav(data):
+    fmt, pcm = parse_wav(data)
+    return wav_header(fmt, len(pcm)) + pcm
+
+async def relay_audio(chunks, key):
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except UpstreamError as e:
+        # Headers are already out, so the only honest signal left is to abort the connection
+        logger.warning("Aborting audio stream %s after headers were sent: %s", key, e.message)
+        raise
+
+async def synthesize(voice, text, pitch, speed, segments=None):
+    chunks, _, _ = await open_synthesis(voice, text, pitch, speed, segments=segments)
+    return b"".join([chunk async for chunk in chunks])
+
+# Long-form synthesis
+LONG_TEXT_MAX_LENGTH = int(os.environ.get("TTS_LONG_TEXT_MAX_LENGTH", "50000"))
+LONG_TEXT_CONCURRENCY = int(os.environ.get("TTS_LONG_TEXT_CONCURRENCY", "4"))
+
+SENTENCE_BREAK = re.compile(r"(?<=[.!?…])[\"')\]]*\s+")
+CLAUSE_BREAK = re.compile(r"(?<=[,;:—])\s+")
+
+def split_text(text, max_length=MAX_TEXT_LENGTH):
+    # Packs sentences into upstream-sized pieces, falling back to clauses, words, then hard cuts
+    pieces = []
+    current = ""
+    for sentence in _split_oversized(text.strip(), max_length):
+        if current and len(current) + 1 + len(sentence) > max_length:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+def _split_oversized(text, max_length):
+    for sentence in SENTENCE_BREAK.split(text):
+        sentence = " ".join(sentence.split())
+        if not sentence:
+            continue
+        if len(sentence) <= max_length:
+            yield sentence
+            continue
+        for clause in CLAUSE_BREAK.split(sentence):
+            while len(clause) > max_length:
+                cut = clause.rfind(" ", 0, max_length + 1)
+                if cut <= 0:
+                    cut = max_length
+                yield clause[:cut].strip()
+                clause = clause[cut:].strip()
+            if clause:
+                yield clause
+
+def parse_wav_header(data):
+    # Returns (fmt payload, data offset, data size), or None while the header is still incomplete
+    if len(data) < 12:
+        return None
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("not a RIFF/WAVE file")
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = int.from_bytes(data[offset + 4:offset + 8], "little")
+        start = offset + 8
+        if chunk_id == b"fmt ":
+            if start + chunk_size > len(data):
+                return None
+            fmt = bytes(data[start:start + chunk_size])
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("'data' chunk before 'fmt ' chunk")
+            return fmt, start, chunk_size
+        offset = start + chunk_size + (chunk_size & 1)
+    return None
+
+def parse_wav(data):
+    # Returns the raw 'fmt ' payload and the PCM from the 'data' chunk
+    header = parse_wav_header(data)
+    if header is None:
+        raise ValueError("missing 'fmt ' or 'data' chunk")
+    fmt, start, size = header
+    # Streamed WAVs carry a placeholder size, so clamp to what we actually have
+    return fmt, data[start:min(start + size, len(data))]
+
+def wav_header(fmt, data_length=None):
+    # Without a known length, use the 0xFFFFFFFF placeholder players accept for streamed WAV
+    if data_length is None:
+        riff_size = data_size = 0xFFFFFFFF
+    else:
+        data_size = data_length
+        riff_size = 4 + 8 + len(fmt) + (len(fmt) & 1) + 8 + data_length
+    header = b"RIFF" + riff_size.to_bytes(4, "little") + b"WAVE"
+    header += b"fmt " + len(fmt).to_bytes(4, "little") + fmt + b"\0" * (len(fmt) & 1)
+    return header + b"data" + data_size.to_bytes(4, "little")
+
+async def synthesize_pieces(voice, pieces, pitch, speed, concurrency=LONG_TEXT_CONCURRENCY):
+    # Synthesizes already-normalized pieces with bounded parallelism, yielding their audio in order.
+    # Each piece is built from the same sentence segments /api/tts caches
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(piece):
+        async with semaphore:
+            return await synthesize(voice, piece, pitch, speed, text_segments(piece) if SEGMENT_CACHE else None)
+
+    tasks = [asyncio.ensure_future(run(piece)) for piece in pieces]
+    try:
+        for task in tasks:
+            yield await task
+    finally:
+        for task in tasks:
+            if task.done():
+                if not task.cancelled():
+                    task.exception()
+            else:
+                task.cancel()
+
+async def stitch_wav(first_fmt, first_pcm, remaining):
+    # Merges per-piece WAVs into one stream under a single header
+    try:
+        yield wav_header(first_fmt) + first_pcm
+        async for audio in remaining:
+            try:
+                fmt, pcm = parse_wav(audio)
+            except ValueError as e:
+                raise UpstreamError(502, f"TTS service returned invalid audio: {str(e)}")
+            if fmt != first_fmt:
+                raise UpstreamError(502, "TTS service returned mismatched audio formats")
+            yield pcm
+    finally:
+        await remaining.aclose()
+
+# Text normalization, so requests that read the same share cache entries
+TEXT_NORMALIZATION = os.environ.get("TTS_NORMALIZE", "1") == "1"
+SEGMENT_CACHE = os.environ.get("TTS_SEGMENT_CACHE", "1") == "1"
+
+SSML_SUB = re.compile(r'<sub\s+alias="([^"]*)"\s*>(.*?)</sub\s*>', re.IGNORECASE | re.DOTALL)
+SSML_TAG = re.compile(r"</?(?:speak|break|emphasis|prosody|say-as|sub|p|s|voice|lang|mark|phoneme|audio)\b[^>]*>|<\?xml[^>]*\?>|<!--.*?-->", re.IGNORECASE | re.DOTALL)
+ABBREVIATIONS = {
+    "Dr": "Doctor",
+    "Mr": "Mister",
+    "Mrs": "Missus",
+    "Ms": "Miz",
+    "Prof": "Professor",
+    "Jr": "Junior",
+    "Sr": "Senior",
+    "vs": "versus",
+    "approx": "approximately",
+}
+ABBREVIATION = re.compile(r"\b(" + "|".join(ABBREVIATIONS) + r")\.(?=\s|$)")
+LATIN_ABBREVIATIONS = [(re.compile(r"\be\.g\.(?=\W|$)", re.IGNORECASE), "for example"), (re.compile(r"\bi\.e\.(?=\W|$)", re.IGNORECASE), "that is")]
+# (unit, units, minor unit, minor units); "$5.99" reads as a price, not "$five point nine nine"
+CURRENCIES = {
+    "$": ("dollar", "dollars", "cent", "cents"),
+    "£": ("pound", "pounds", "penny", "pence"),
+    "€": ("euro", "euros", "cent", "cents"),
+    "¥": ("yen", "yen", None, None),
+}
+CURRENCY = re.compile(r"(?<![\w.,:])(-?)([$£€¥])(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d+))?(?:\s+(thousand|million|billion|trillion)\b)?(?![\w,.:]\d|\w)")
+# Numbers next to a currency symbol not named above are left as written
+NUMBER = re.compile(r"(?<![\w.,:$£€¥₹₩₽₺¢])(-?)(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d+))?(st|nd|rd|th|%)?(?![\w,.:]\d|\w)")
+# Words whose tail is lowercase fold to lowercase in cache keys; acronyms like "NASA" keep their capitals
+FOLDABLE_WORD = re.compile(r"\b[A-Z][a-z']+\b")
+
+SMALL_NUMBERS = (
+    "zero one two three four five six seven eight nine ten eleven twelve thirteen "
+    "fourteen fifteen sixteen seventeen eighteen nineteen"
+).split()
+TENS = "_ _ twenty thirty forty fifty sixty seventy eighty ninety".split()
+SCALES = [(10 ** 12, "trillion"), (10 ** 9, "billion"), (10 ** 6, "million"), (1000, "thousand")]
+ORDINAL_WORDS = {"one": "first", "two": "second", "three": "third", "five": "fifth", "eight": "eighth", "nine": "ninth", "twelve": "twelfth"}
+
+def number_words(n):
+    if n < 20:
+        return SMALL_NUMBERS[n]
+    if n < 100:
+        return TENS[n // 10] + ("-" + SMALL_NUMBERS[n % 10] if n % 10 else "")
+    if n < 1000:
+        return SMALL_NUMBERS[n // 100] + " hundred" + (" " + number_words(n % 100) if n % 100 else "")
+    for scale, name in SCALES:
+        if n >= scale:
+            return number_words(n // scale) + " " + name + (" " + number_words(n % scale) if n % scale else "")
+
+def ordinal_words(words):
+    head, _, last = words.rpartition(" ")
+    prefix, dash, last = last.rpartition("-")
+    if last in ORDINAL_WORDS:
+        last = ORDINAL_WORDS[last]
+    elif last.endswith("y"):
+        last = last[:-1] + "ieth"
+    else:
+        last += "th"
+    return (head + " " if head else "") + prefix + dash + last
+
+def expand_number(match):
+    sign, whole, fraction, suffix = match.groups()
+    digits = whole.replace(",", "")
+    if len(digits) > 15 or (len(digits) > 1 and digits.startswith("0")):
+        # Phone numbers, IDs and zero-padded codes read best digit by digit
+        words = " ".join(SMALL_NUMBERS[int(digit)] for digit in digits)
+    elif whole == digits and not (sign or fraction or suffix) and 1100 <= int(digits) < 2100 and not 2000 <= int(digits) < 2010:
+        # Read like a year: "nineteen ninety-nine", "nineteen hundred"
+        century, rest = divmod(int(digits), 100)
+        words = number_words(century) + " " + (number_words(rest) if rest >= 10 else f"oh {number_words(rest)}" if rest else "hundred")
+    else:
+        words = number_words(int(digits))
+    if fraction:
+        words += " point " + " ".join(SMALL_NUMBERS[int(digit)] for digit in fraction)
+    if suffix == "%":
+        words += " percent"
+    elif suffix and not fraction:
+        words = ordinal_words(words)
+    return ("minus " if sign else "") + words
+
+def expand_currency(match):
+    sign, symbol, whole, fraction, scale = match.groups()
+    unit, units, minor, minors = CURRENCIES[symbol]
+    digits = whole.replace(",", "")
+    if len(digits) > 15:
+        return match.group(0)
+    amount = int(digits)
+    minor_amount = int(fraction) if fraction and len(fraction) == 2 and minor and not scale else None
+    if fraction and minor_amount is None:
+        # "$1.5 million", "$2.125": the figure as a decimal, then the unit
+        words = number_words(amount) + " point " + " ".join(SMALL_NUMBERS[int(digit)] for digit in fraction)
+        words += (" " + scale if scale else "") + " " + units
+    elif scale:
+        words = f"{number_words(amount)} {scale} {units}"
+    else:
+        parts = []
+        if amount or not minor_amount:
+            parts.append(f"{number_words(amount)} {unit if amount == 1 else units}")
+        if minor_amount:
+            parts.append(f"{number_words(minor_amount)} {minor if minor_amount == 1 else minors}")
+        words = " and ".join(parts)
+    return ("minus " if sign else "") + words
+
+SSML_VOICE = re.compile(r"<voice\b[^>]*\bname\s*=\s*[\"']([^\"']*)[\"']", re.IGNORECASE)
+SSML_PROSODY = re.compile(r"<prosody\b([^>]*)>", re.IGNORECASE)
+SSML_ATTRIBUTE = re.compile(r"\b(pitch|rate)\s*=\s*[\"']([^\"']*)[\"']", re.IGNORECASE)
+SSML_PROSODY_LEVELS = {
+    "pitch": {"x-low": 75, "low": 110, "medium": 150, "default": 150, "high": 190, "x-high": 225},
+    "rate": {"x-slow": 75, "slow": 110, "medium": 150, "default": 150, "fast": 190, "x-fast": 225},
+}
+SSML_PROSODY_VALUE = re.compile(r"^([+-]?)(\d+(?:\.\d+)?)(%?)$")
+# html.unescape's own pattern, so entities can be replaced one match at a time
+HTML_CHARREF = re.compile(r"&(#[0-9]+;?|#[xX][0-9a-fA-F]+;?|[^\t\n\f <&#;]{1,32};?)")
+
+def ssml_steps(text):
+    if "<" not in text:
+        return []
+    return [(SSML_SUB, r" \1 "), (SSML_TAG, " "), (HTML_CHARREF, lambda match: html.unescape(match.group(0)))]
+
+def strip_ssml(text):
+    for pattern, replacement in ssml_steps(text):
+        text = pattern.sub(replacement, text)
+    return text
+
+def display_text(text, markup):
+    # Source text as a reader sees it: <sub> shows what it wraps rather than its alias
+    if markup:
+        text = html.unescape(SSML_TAG.sub(" ", SSML_SUB.sub(r"\2", text)))
+    return " ".join(text.split())
+
+def ssml_settings(text, voice, pitch, speed):
+    # SAPI4 takes one voice, pitch and speed per request, so the first <voice name> and
+    # <prosody pitch/rate> apply to the whole text; returns (voice, pitch, speed)
+    match = SSML_VOICE.search(text)
+    if match:
+        voice = match.group(1)
+    match = SSML_PROSODY.search(text)
+    for name, value in SSML_ATTRIBUTE.findall(match.group(1)) if match else []:
+        name, value = name.lower(), value.strip().lower()
+        current = pitch if name == "pitch" else speed
+        if value in SSML_PROSODY_LEVELS[name]:
+            current = SSML_PROSODY_LEVELS[name][value]
+        elif SSML_PROSODY_VALUE.match(value):
+            sign, number, percent = SSML_PROSODY_VALUE.match(value).groups()
+            number = float(number) * (-1 if sign == "-" else 1)
+            if percent and sign:
+                current = current * (1 + number / 100)
+            elif percent:
+                current = current * number / 100
+            elif sign:
+                current = current + number
+            else:
+                current = number
+        if name == "pitch":
+            pitch = int(round(current))
+        else:
+            speed = int(round(current))
+    return voice, pitch, speed
+
+def normalization_steps(text):
+    # (pattern, replacement) substitutions normalize_text applies, in order
+    return [
+        *ssml_steps(text),
+        (ABBREVIATION, lambda match: ABBREVIATIONS[match.group(1)]),
+        *LATIN_ABBREVIATIONS,
+        (CURRENCY, expand_currency),
+        (NUMBER, expand_number),
+    ]
+
+def normalize_text(text):
+    # Strips SSML-lite markup, expands numbers and abbreviations and collapses whitespace
+    for pattern, replacement in normalization_steps(text):
+        text = pattern.sub(replacement, text)
+    return " ".join(text.split())
+
+def spoken_words(text):
+    # The words prepare_text speaks, each with the (start, end) of the source text it came from.
+    # Every character a substitution writes maps to the whole span its match replaced
+    spans = [(index, index + 1) for index in range(len(text))]
+    for pattern, replacement in normalization_steps(text) if TEXT_NORMALIZATION else []:
+        pieces, mapped, position = [], [], 0
+        for match in pattern.finditer(text):
+            replaced = replacement(match) if callable(replacement) else match.expand(replacement)
+            pieces += [text[position:match.start()], replaced]
+            mapped += spans[position:match.start()] + [(spans[match.start()][0], spans[match.end() - 1][1])] * len(replaced)
+            position = match.end()
+        pieces.append(text[position:])
+        mapped += spans[position:]
+        text, spans = "".join(pieces), mapped
+    return [(match.group(0), spans[match.start()][0], spans[match.end() - 1][1]) for match in WORD_TOKEN.finditer(text)]
+
+def fold_case(text):
+    # Only the cache key is folded; the engine still gets the capitals, which may shape its prosody
+    return FOLDABLE_WORD.sub(lambda match: match.group(0).lower(), text)
+
+def prepare_text(text):
+    # Returns the text as it will be spoken, and its separately cached segments
+    if TEXT_NORMALIZATION:
+        text = normalize_text(text)
+    return text, (text_segments(text) if SEGMENT_CACHE and text else None)
+
+def text_segments(text):
+    # Sentence-sized pieces, each cached on its own so a new request only pays for unseen sentences
+    return list(_split_oversized(text, MAX_TEXT_LENGTH))
+
+# Request- and segment-level cache outcomes, so the two hit ratios can be told apart
+CACHE_LOOKUPS = Counter("voicecraft_cache_lookups_total", "Synthesis cache lookups by level and result", ("level", "result"))
+
+def record_cache_lookup(level, cache_status):
+    CACHE_LOOKUPS.inc(level=level, result=cache_status.lower())
+
+def cache_hit_ratios():
+    ratios = {}
+    for level in ("request", "segment"):
+        counts = {result: count for (lookup_level, result), count in CACHE_LOOKUPS.values.items() if lookup_level == level}
+        total = sum(counts.values())
+        ratios[level] = {**counts, "hit_ratio": round(counts.get("hit", 0) / total, 4) if total else None}
+    return ratios
+
+async def stream_segments(broadcast, voice, segments, pitch, speed, concurrency=LONG_TEXT_CONCURRENCY):
+    # Splices per-segment WAVs (each cached and coalesced on its own) into one stream, in order
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(segment):
+        async with semaphore:
+            chunks, _, cache_status = await open_synthesis(voice, segment, pitch, speed)
+            record_cache_lookup("segment", cache_status)
+            return b"".join([chunk async for chunk in chunks])
+
+    tasks = [asyncio.ensure_future(run(segment)) for segment in segments]
+    try:
+        first_fmt = None
+        for task in tasks:
+            try:
+                fmt, pcm = parse_wav(await task)
+            except ValueError as e:
+                raise UpstreamError(502, f"TTS service returned invalid audio: {str(e)}")
+            if first_fmt is None:
+                first_fmt = fmt
+                broadcast.start()
+                broadcast.publish(wav_header(fmt))
+            elif fmt != first_fmt:
+                raise UpstreamError(502, "TTS service returned mismatched audio formats")
+            broadcast.publish(pcm)
+        broadcast.finish()
+    except UpstreamError as e:
+        broadcast.fail(e)
+    finally:
+        for task in tasks:
+            if task.done():
+                if not task.cancelled():
+                    task.exception()
+            else:
+                task.cancel()
+
+# Output formats: name -> (media type, file extension)
+AUDIO_FORMATS = {
+    "wav": ("audio/wav", "wav"),
+    "mp3": ("audio/mpeg", "mp3"),
+    "ogg": ("audio/ogg; codecs=opus", "ogg"),
+}
+FORMAT_ALIASES = {"wave": "wav", "mpeg": "mp3", "opus": "ogg"}
+ACCEPT_FORMATS = {
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+    "audio/vnd.wave": "wav",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/ogg": "ogg",
+    "audio/opus": "ogg",
+}
+MP3_BITRATE = int(os.environ.get("TTS_MP3_BITRATE", "64"))
+OPUS_BITRATE = os.environ.get("TTS_OPUS_BITRATE", "32k")
+FFMPEG_PATH = os.environ.get("FFMPEG_PATH") or shutil.which("ffmpeg")
+
+def available_formats():
+    formats = ["wav"]
+    if lameenc is not None:
+        formats.append("mp3")
+    if FFMPEG_PATH:
+        formats.append("ogg")
+    return formats
+
+def default_format():
+    return "mp3" if lameenc is not None else "wav"
+
+def negotiate_format(requested, accept):
+    # An explicit format wins; otherwise take the best available match from Accept
+    if requested:
+        requested = requested.strip().lower()
+        return FORMAT_ALIASES.get(requested, requested)
+    preferences = []
+    for position, item in enumerate((accept or "").split(",")):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_type and quality > 0:
+            preferences.append((-quality, position, media_type.lower()))
+    formats = available_formats()
+    for _, _, media_type in sorted(preferences):
+        if media_type in ("*/*", "audio/*"):
+            return default_format()
+        if ACCEPT_FORMATS.get(media_type) in formats:
+            return ACCEPT_FORMATS[media_type]
+    return default_format()
+
+def wav_format(fmt):
+    # Returns (format tag, channels, sample rate, bits per sample) from a 'fmt ' payload
+    if len(fmt) < 16:
+        raise ValueError("truncated 'fmt ' chunk")
+    tag, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", fmt[:16])
+    return tag, channels, sample_rate, bits
+
+async def iter_pcm(chunks):
+    # Splits a streamed WAV into its 'fmt ' payload and block-aligned PCM
+    header = bytearray()
+    fmt = None
+    remaining = 0
+    block_align = 1
+    pending = b""
+    async for chunk in chunks:
+        if fmt is None:
+            header += chunk
+            try:
+                parsed = parse_wav_header(header)
+            except ValueError as e:
+                raise UpstreamError(502, f"TTS service returned invalid audio: {str(e)}")
+            if parsed is None:
+                continue
+            fmt, start, remaining = parsed
+            block_align = max(1, int.from_bytes(fmt[12:14], "little"))
+            chunk = bytes(header[start:])
+        data = pending + chunk[:remaining]
+        remaining -= min(len(chunk), remaining)
+        usable = len(data) - len(data) % block_align
+        pending = data[usable:]
+        if usable:
+            yield fmt, data[:usable]
+    if fmt is None:
+        raise UpstreamError(502, "TTS service returned invalid audio: missing 'fmt ' or 'data' chunk")
+
+def to_s16(pcm, bits):
+    if bits == 16:
+        return pcm
+    if bits == 8:
+        # Unsigned 8-bit to signed 16-bit: flip the sign bit and use it as the high byte
+        wide = bytearray(len(pcm) * 2)
+        wide[1::2] = pcm.translate(SIGN_FLIP)
+        return bytes(wide)
+    raise UpstreamError(502, f"Unsupported upstream sample width: {bits} bits")
+
+SIGN_FLIP = bytes(value ^ 0x80 for value in range(256))
+
+async def encode_mp3(chunks):
+    encoder = None
+    async for fmt, pcm in iter_pcm(chunks):
+        if encoder is None:
+            tag, channels, sample_rate, bits = wav_format(fmt)
+            if tag != 1:
+                raise UpstreamError(502, f"Unsupported upstream audio encoding: {tag}")
+            encoder = lameenc.Encoder()
+            encoder.set_bit_rate(MP3_BITRATE)
+            encoder.set_in_sample_rate(sample_rate)
+            encoder.set_channels(channels)
+            encoder.set_quality(2)
+        data = encoder.encode(to_s16(pcm, bits))
+        if data:
+            yield bytes(data)
+    if encoder is not None:
+        yield bytes(encoder.flush())
+
+async def encode_ogg(chunks):
+    process = await asyncio.create_subprocess_exec(
+        FFMPEG_PATH, "-hide_banner", "-loglevel", "error",
+        "-f", "wav", "-i", "pipe:0",
+        "-c:a", "libopus", "-b:a", OPUS_BITRATE, "-f", "ogg", "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+
+    async def feed():
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        finally:
+            process.stdin.close()
+
+    feeder = asyncio.ensure_future(feed())
+    try:
+        while True:
+            data = await process.stdout.read(64 * 1024)
+            if not data:
+                break
+            yield data
+        # Surfaces upstream errors that cut the input short
+        await feeder
+        if await process.wait() != 0:
+            raise UpstreamError(500, "Audio transcoding failed")
+    finally:
+        if not feeder.done():
+            feeder.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+ENCODERS = {"mp3": encode_mp3, "ogg": encode_ogg}
+
+# Audio post-processing (loudness, silence trimming, resampling, channel layout)
+PEAK_TARGET_DBFS = float(os.environ.get("TTS_PEAK_TARGET_DBFS", "-1"))
+RMS_TARGET_DBFS = float(os.environ.get("TTS_RMS_TARGET_DBFS", "-20"))
+TRIM_THRESHOLD_DBFS = float(os.environ.get("TTS_TRIM_THRESHOLD_DBFS", "-50"))
+TRIM_PADDING = 0.01
+# Downsampling filter: a Kaiser-windowed sinc with its -6 dB point at this fraction of the new
+# Nyquist frequency, this many zero crossings each side (about -80 dB past the new Nyquist)
+RESAMPLE_CUTOFF = 0.9
+RESAMPLE_ZERO_CROSSINGS = 16
+RESAMPLE_KAISER_BETA = 8.0
+RESAMPLE_KERNEL_CACHE = 16
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 48000
+
+def processing_spec(normalize="", trim=False, sample_rate=0, channels=0):
+    # Returns (canonical spec, error); the spec names the processed variant in the cache
+    normalize = (normalize or "").strip().lower()
+    if normalize not in ("", "peak", "rms"):
+        return None, "Normalize must be 'peak' or 'rms'"
+    if sample_rate and not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        return None, f"Sample rate must be between {MIN_SAMPLE_RATE} and {MAX_SAMPLE_RATE}"
+    if channels not in (0, 1, 2):
+        return None, "Channels must be 1 or 2"
+    parts = []
+    if trim:
+        parts.append("trim")
+    if normalize:
+        parts.append(normalize)
+    if sample_rate:
+        parts.append(f"{sample_rate}hz")
+    if channels:
+        parts.append(f"{channels}ch")
+    if parts and not NUMPY_AVAILABLE:
+        return None, "Audio post-processing is not available on this server"
+    return ".".join(parts) or None, None
+
+# (up, down) -> (half width, taps per phase); a handful of rate pairs covers nearly every request
+resample_kernels = {}
+
+def resample_kernel(up, down):
+    # Row p holds the taps for an output sample p/up of the way past its nearest earlier input sample
+    kernel = resample_kernels.get((up, down))
+    if kernel is not None:
+        return kernel
+    scale = RESAMPLE_CUTOFF * up / down
+    half = math.ceil(RESAMPLE_ZERO_CROSSINGS / scale)
+    distance = np.arange(1 - half, half + 1)[None, :] - np.arange(up)[:, None] / up
+    window = np.i0(RESAMPLE_KAISER_BETA * np.sqrt(np.clip(1 - (distance / half) ** 2, 0.0, None))) / np.i0(RESAMPLE_KAISER_BETA)
+    taps = np.sinc(scale * distance) * window
+    # Unity gain at DC for every phase, so silence and offsets don't ripple
+    taps = (taps / taps.sum(axis=1, keepdims=True)).astype(np.float32)
+    kernel = half, taps
+    if len(resample_kernels) < RESAMPLE_KERNEL_CACHE:
+        resample_kernels[(up, down)] = kernel
+    return kernel
+
+def downsample(audio, sample_rate, target_rate):
+    # Polyphase windowed-sinc resampler: filters and decimates in one pass, computing only the
+    # output samples. Outputs sharing a phase are a strided view times one tap row
+    divisor = math.gcd(sample_rate, target_rate)
+    up, down = target_rate // divisor, sample_rate // divisor
+    half, taps = resample_kernel(up, down)
+    frames = max(1, round(len(audio) * up / down))
+    resampled = np.empty((frames, audio.shape[1]), dtype=np.float32)
+    for channel in range(audio.shape[1]):
+        padded = np.pad(audio[:, channel], (half, half + down + 1))
+        step = padded.strides[0]
+        for phase in range(min(up, frames)):
+            # Output phase + k*up sits at input (phase*down + k*up*down) / up
+            first = phase * down // up + 1
+            count = (frames - phase + up - 1) // up
+            windows = np.lib.stride_tricks.as_strided(padded[first:], shape=(count, 2 * half), strides=(down * step, step))
+            resampled[phase::up, channel] = windows @ taps[phase * down % up]
+    return resampled
+
+def process_wav(data, spec):
+    # Applies a processing spec to a PCM WAV, returning 16-bit PCM WAV
+    fmt, pcm = parse_wav(data)
+    tag, channels, sample_rate, bits = wav_format(fmt)
+    if tag != 1 or bits not in (8, 16):
+        raise ValueError(f"unsupported encoding {tag} at {bits} bits")
+    steps = spec.split(".")
+    pcm = to_s16(pcm, bits)
+    load_numpy()
+    samples = np.frombuffer(pcm[:len(pcm) - len(pcm) % (2 * channels)], dtype="<i2")
+    audio = samples.reshape(-1, channels).astype(np.float32) / 32768.0
+
+    if "trim" in steps and len(audio):
+        loud = np.flatnonzero(np.abs(audio).max(axis=1) > 10 ** (TRIM_THRESHOLD_DBFS / 20))
+        # A clip that is silence throughout is left as it is
+        if len(loud):
+            padding = int(sample_rate * TRIM_PADDING)
+            audio = audio[max(0, loud[0] - padding):loud[-1] + 1 + padding]
+
+    target_channels = next((int(step[:-2]) for step in steps if step.endswith("ch")), channels)
+    if target_channels != channels:
+        mono = audio.mean(axis=1, keepdims=True)
+        audio = np.repeat(mono, target_channels, axis=1)
+        channels = target_channels
+
+    target_rate = next((int(step[:-2]) for step in steps if step.endswith("hz")), sample_rate)
+    if target_rate != sample_rate and len(audio) > 1:
+        if target_rate < sample_rate:
+            # Band-limited, so nothing above the new Nyquist frequency folds back as an alias
+            audio = downsample(audio, sample_rate, target_rate)
+        else:
+            # Linear interpolation; there is nothing above the old Nyquist frequency to fold back
+            frames = max(1, round(len(audio) * target_rate / sample_rate))
+            source = np.arange(len(audio), dtype=np.float64)
+            positions = np.linspace(0, len(audio) - 1, frames)
+            audio = np.stack([np.interp(positions, source, audio[:, channel]) for channel in range(channels)], axis=1).astype(np.float32)
+    sample_rate = target_rate
+
+    if len(audio) and ("peak" in steps or "rms" in steps):
+        peak = float(np.abs(audio).max())
+        if peak > 0:
+            ceiling = 10 ** (PEAK_TARGET_DBFS / 20)
+            if "peak" in steps:
+                gain = ceiling / peak
+            else:
+                rms = float(np.sqrt(np.mean(np.square(audio, dtype=np.float64))))
+                # Never push peaks past the ceiling to reach the RMS target
+                gain = min(10 ** (RMS_TARGET_DBFS / 20) / rms, ceiling / peak)
+            audio = audio * gain
+
+    pcm = np.clip(np.rint(audio * 32767.0), -32768, 32767).astype("<i2").tobytes()
+    fmt = struct.pack("<HHIIHH", 1, channels, sample_rate, sample_rate * channels * 2, channels * 2, 16)
+    return wav_header(fmt, len(pcm)) + pcm
+
+# Word timing marks for captions and lip-sync
+MARKS_FRAME_SECONDS = 0.01
+MARKS_VOICED_DB = float(os.environ.get("TTS_MARKS_VOICED_DB", "-30"))
+MARKS_CUE_WORDS = 7
+MARKS_PUNCTUATION = ".,;:!?\"'()[]"
+WORD_TOKEN = re.compile(r"\S+")
+
+def wav_to_mono(data):
+    # Returns (float32 mono samples, sample rate) from a PCM WAV
+    fmt, pcm = parse_wav(data)
+    tag, channels, sample_rate, bits = wav_format(fmt)
+    if tag != 1 or bits not in (8, 16):
+        raise ValueError(f"unsupported encoding {tag} at {bits} bits")
+    pcm = to_s16(pcm, bits)
+    load_numpy()
+    samples = np.frombuffer(pcm[:len(pcm) - len(pcm) % (2 * channels)], dtype="<i2")
+    return samples.reshape(-1, channels).mean(axis=1, dtype=np.float32) / 32768.0, sample_rate
+
+def align_words(data, text):
+    # Energy-based alignment: spread the words over the voiced frames in proportion to their
+    # length, so pauses in the audio fall between words. Returns ([(word, start, end)], duration)
+    samples, sample_rate = wav_to_mono(data)
+    duration = len(samples) / sample_rate
+    tokens = [token for token in WORD_TOKEN.findall(text) if any(char.isalnum() for char in token)]
+    frame = max(1, int(sample_rate * MARKS_FRAME_SECONDS))
+    frames = len(samples) // frame
+    if not tokens or not frames:
+        return [], duration
+    energy = np.sqrt(np.mean(np.square(samples[:frames * frame].reshape(frames, frame)), axis=1))
+    voiced = np.flatnonzero(energy > energy.max() * 10 ** (MARKS_VOICED_DB / 20))
+    if not len(voiced):
+        voiced = np.arange(frames)
+    # Trailing punctuation usually means a pause, which the voiced-frame budget doesn't see
+    weights = np.array([sum(char.isalnum() for char in token) + (2 if token[-1] in ",;:.!?" else 0) for token in tokens], dtype=np.float64)
+    bounds = np.rint(np.concatenate(([0.0], np.cumsum(weights))) / weights.sum() * len(voiced)).astype(int)
+    words = []
+    for index, token in enumerate(tokens):
+        first = min(bounds[index], len(voiced) - 1)
+        last = max(first, bounds[index + 1] - 1)
+        word = token.strip(MARKS_PUNCTUATION)
+        words.append((word, round(float(voiced[first]) * frame / sample_rate, 3), round(float(voiced[last] + 1) * frame / sample_rate, 3)))
+    return words, duration
+
+def display_word(source, start, end, first_token, last_token):
+    # The source text behind one or more spoken words, less the punctuation the spoken form
+    # carries too ("$3." reads "three dollars."), so an abbreviation keeps its own period
+    word = display_text(source[start:end], "<" in source)
+    lead = first_token[:len(first_token) - len(first_token.lstrip(MARKS_PUNCTUATION))]
+    tail = last_token[len(last_token.rstrip(MARKS_PUNCTUATION)):]
+    return word.removeprefix(lead).removesuffix(tail)
+
+async def compute_marks(voice, text, pitch, speed, key, segments, source):
+    # Aligns each segment against its own (cached) audio, offset by the segments before it,
+    # so the marks line up with the spliced WAV /api/tts serves. Words are aligned as spoken,
+    # then reported as the source wrote them: "$3" is one mark spoken as "three dollars"
+    units = segments if segments and len(segments) > 1 else [text]
+    sources = iter([word for word in spoken_words(source) if any(char.isalnum() for char in word[0])])
+    offset = 0.0
+    marks = {"key": key, "voice": voice, "pitch": pitch, "speed": speed, "sentences": [], "words": []}
+    groups = []
+    for index, unit in enumerate(units):
+        chunks, _, _ = await open_synthesis(voice, unit, pitch, speed)
+        audio_content = b"".join([chunk async for chunk in chunks])
+        try:
+            words, duration = await asyncio.to_thread(align_words, audio_content, unit)
+        except ValueError as e:
+            raise UpstreamError(502, f"TTS service returned audio that can't be aligned: {str(e)}")
+        marks["sentences"].append({"index": index, "text": unit, "spoken": unit, "start": round(offset, 3), "end": round(offset + duration, 3)})
+        for word, start, end in words:
+            token, first, last = next(sources, (None, None, None))
+            if token is None or token.strip(MARKS_PUNCTUATION) != word:
+                # Only a hard cut through an over-long word splits tokens differently; stop mapping
+                sources = iter(())
+                token = first = last = None
+            previous = groups[-1] if groups else None
+            if first is not None and previous and previous["sentence"] == index and previous["last"] is not None and first < previous["last"]:
+                # Words written by one substitution share its source span
+                previous.update(end=offset + end, last=max(last, previous["last"]), last_token=token)
+                previous["spoken"].append(word)
+                continue
+            groups.append({
+                "spoken": [word], "start": offset + start, "end": offset + end, "sentence": index,
+                "first": first, "last": last, "first_token": token, "last_token": token,
+            })
+        offset += duration
+    for group in groups:
+        spoken = " ".join(group["spoken"])
+        word = spoken
+        if group["first"] is not None:
+            word = display_word(source, group["first"], group["last"], group["first_token"], group["last_token"]) or spoken
+        marks["words"].append({"word": word, "spoken": spoken, "start": round(group["start"], 3), "end": round(group["end"], 3), "sentence": group["sentence"]})
+    for sentence in marks["sentences"]:
+        spans = [(group["first"], group["last"]) for group in groups if group["sentence"] == sentence["index"] and group["first"] is not None]
+        if spans:
+            sentence["text"] = display_text(source[spans[0][0]:spans[-1][1]], "<" in source)
+    marks["duration"] = round(offset, 3)
+    return marks
+
+def vtt_timestamp(seconds):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    return f"{hours:02d}:{minutes:02d}:{milliseconds // 1000:02d}.{milliseconds % 1000:03d}"
+
+def marks_to_vtt(marks):
+    # One cue per few words of a sentence, with karaoke-style inline word timestamps
+    lines = ["WEBVTT", ""]
+    cue = []
+    for position, word in enumerate(marks["words"]):
+        cue.append(word)
+        following = marks["words"][position + 1] if position + 1 < len(marks["words"]) else None
+        if len(cue) < MARKS_CUE_WORDS and following is not None and following["sentence"] == word["sentence"]:
+            continue
+        # Source words can carry "&" or "<", which WebVTT cue text must escape
+        text = html.escape(cue[0]["word"], quote=False) + "".join(
+            f" <{vtt_timestamp(item['start'])}>{html.escape(item['word'], quote=False)}" for item in cue[1:]
+        )
+        lines += [f"{vtt_timestamp(cue[0]['start'])} --> {vtt_timestamp(cue[-1]['end'])}", text, ""]
+        cue = []
+    return "\n".join(lines)
+
+# Batch synthesis
+BATCH_MAX_ITEMS = int(os.environ.get("TTS_BATCH_MAX_ITEMS", "1000"))
+BATCH_CONCURRENCY = int(os.environ.get("TTS_BATCH_CONCURRENCY", "8"))
+
+async def synthesize_batch(items, concurrency=BATCH_CONCURRENCY):
+    # Yields (index, item, audio, error) as each item completes; one bad item never fails the rest
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(index, item):
+        item.voice = resolve_voice(item.voice)
+        error = validate_tts_params(item.voice, item.text, item.pitch, item.speed)
+        if error:
+            return index, item, None, UpstreamError(400, error)
+        text, segments = prepare_text(item.text)
+        if not text:
+            return index, item, None, UpstreamError(400, "Voice and text parameters are required")
+        try:
+            async with semaphore:
+                audio = await synthesize(item.voice, text, item.pitch, item.speed, segments)
+            return index, item, audio, None
+        except UpstreamError as e:
+            return index, item, None, e
+
+    tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def batch_item_result(index, item, audio, error):
+    result = {
+        "index": index,
+        "voice": item.voice,
+        "pitch": item.pitch,
+        "speed": item.speed,
+        # The same key /api/tts uses as its ETag for these parameters
+        "key": synthesis_key(item.voice, prepare_text(item.text)[0], item.pitch, item.speed),
+    }
+    if error is not None:
+        result.update({"status": False, "status_code": error.status_code, "message": error.message})
+    else:
+        result.update({"status": True, "status_code": 200, "bytes": len(audio)})
+    return result
+
+async def stream_batch_ndjson(results):
+    async for index, item, audio, error in results:
+        line = batch_item_result(index, item, audio, error)
+        if audio is not None:
+            line["audio"] = base64.b64encode(audio).decode("ascii")
+        yield json.dumps(line) + "\n"
+
+class ZipStream:
+    # Write-only sink for zipfile; without seek() zipfile writes streamable entries with data descriptors
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offset = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+async def stream_batch_zip(results):
+    sink = ZipStream()
+    manifest = []
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+        async for index, item, audio, error in results:
+            entry = batch_item_result(index, item, audio, error)
+            if audio is not None:
+                entry["file"] = f"{index:05d}-{re.sub(r'[^a-zA-Z0-9]+', '-', item.voice).strip('-')}.wav"
+                archive.writestr(entry["file"], audio)
+                yield sink.drain()
+            manifest.append(entry)
+        manifest.sort(key=lambda entry: entry["index"])
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+    yield sink.drain()
+
+# Asynchronous jobs
+JOBS_DB_PATH = os.environ.get("TTS_JOBS_DB", os.path.join(tempfile.gettempdir(), "voicecraft-jobs.sqlite3"))
+JOBS_WORKERS = int(os.environ.get("TTS_JOBS_WORKERS", "2"))
+JOBS_POLL_INTERVAL = float(os.environ.get("TTS_JOBS_POLL_INTERVAL", "1.0"))
+JOBS_STALE_SECONDS = float(os.environ.get("TTS_JOBS_STALE_SECONDS", "300"))
+# Finished and failed jobs, audio included, are deleted this long after they last changed
+JOBS_TTL = float(os.environ.get("TTS_JOBS_TTL", "86400"))
+# Transient upstream failures requeue the job with exponential backoff before it is failed
+JOBS_MAX_ATTEMPTS = int(os.environ.get("TTS_JOBS_MAX_ATTEMPTS", "5"))
+JOBS_RETRY_BASE = float(os.environ.get("TTS_JOBS_RETRY_BASE", "2.0"))
+JOBS_RETRY_MAX = float(os.environ.get("TTS_JOBS_RETRY_MAX", "60.0"))
+JOBS_MAX_WAIT = 30
+
+class JobStore:
+    # SQLite-backed queue, so queued and finished jobs survive restarts and are shared by workers
+
+    def __init__(self, path):
+        self.path = path
+        self.initialized = False
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            if not self.initialized:
+                conn.executescript("""
+                    PRAGMA journal_mode=WAL;
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        key TEXT NOT NULL,
+                        voice TEXT NOT NULL,
+                        text TEXT NOT NULL,
+                        pitch INTEGER NOT NULL,
+                        speed INTEGER NOT NULL,
+                        status TEXT NOT NULL,
+                        pieces_total INTEGER NOT NULL,
+                        pieces_done INTEGER NOT NULL DEFAULT 0,
+                        error_code INTEGER,
+                        error TEXT,
+                        audio BLOB,
+                        created_at REAL NOT NULL,
+                        updated_at REAL NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        not_before REAL NOT NULL DEFAULT 0
+                    );
+                    CREATE INDEX IF NOT EXISTS jobs_by_key ON jobs (key, created_at);
+                    CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+                    CREATE INDEX IF NOT EXISTS jobs_by_updated ON jobs (status, updated_at);
+                """)
+                # Databases created before retries existed lack the retry columns
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+                if "attempts" not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+                if "not_before" not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN not_before REAL NOT NULL DEFAULT 0")
+                self.initialized = True
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, key, voice, text, pitch, speed, pieces_total):
+        # Returns (job, created); a live or finished job with the same key is reused
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE key = ? AND status != 'failed' ORDER BY created_at DESC LIMIT 1",
+                    (key,),
+                ).fetchone()
+                if row is not None:
+                    conn.execute("COMMIT")
+                    return self._to_dict(row), False
+                now = time.time()
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO jobs (id, key, voice, text, pitch, speed, status, pieces_total, created_at, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                    (job_id, key, voice, text, pitch, speed, pieces_total, now, now),
+                )
+                row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                conn.execute("COMMIT")
+                return self._to_dict(row), True
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def claim(self):
+        # Takes the oldest queued job whose backoff has passed, or a running one whose worker
+        # stopped reporting progress. Expired finished jobs are swept on the way
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                conn.execute(
+                    "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                    (now - JOBS_TTL,),
+                )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE (status = 'queued' AND not_before <= ?)"
+                    " OR (status = 'running' AND updated_at < ?) ORDER BY created_at LIMIT 1",
+                    (now, now - JOBS_STALE_SECONDS),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', pieces_done = 0, updated_at = ? WHERE id = ?",
+                        (now, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self._to_dict(row, include_text=True) if row is not None else None
+
+    def progress(self, job_id, pieces_done):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET pieces_done = ?, updated_at = ? WHERE id = ?", (pieces_done, time.time(), job_id))
+
+    def complete(self, job_id, audio):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', pieces_done = pieces_total, audio = ?, updated_at = ? WHERE id = ?",
+                (audio, time.time(), job_id),
+            )
+
+    def fail(self, job_id, error_code, error):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error_code = ?, error = ?, updated_at = ? WHERE id = ?",
+                (error_code, error, time.time(), job_id),
+            )
+
+    def retry(self, job_id, error_code, error, delay):
+        # Back to the queue, not claimable for delay seconds; the last error is kept for diagnosis
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = attempts + 1, not_before = ?, pieces_done = 0,"
+                " error_code = ?, error = ?, updated_at = ? WHERE id = ?",
+                (now + delay, error_code, error, now, job_id),
+            )
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def get_audio(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT audio FROM jobs WHERE id = ? AND status = 'done'", (job_id,)).fetchone()
+        return row["audio"] if row is not None else None
+
+    def stats(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+    def _to_dict(self, row, include_text=False):
+        skipped = ("audio",) if include_text else ("audio", "text")
+        return {name: row[name] for name in row.keys() if name not in skipped}
+
+job_store = JobStore(JOBS_DB_PATH)
+job_workers = []
+job_wakeup = None
+job_events = {}
+
+def notify_job(job_id):
+    event = job_events.pop(job_id, None)
+    if event is not None:
+        event.set()
+
+async def run_job(job):
+    remaining = synthesize_pieces(job["voice"], split_text(job["text"]), job["pitch"], job["speed"])
+    chunks = []
+    try:
+        try:
+            fmt, pcm = parse_wav(await remaining.__anext__())
+        except ValueError as e:
+            raise UpstreamError(502, f"TTS service returned invalid audio: {str(e)}")
+        # One chunk per piece, the first carrying the header
+        async for chunk in stitch_wav(fmt, pcm, remaining):
+            chunks.append(chunk)
+            await asyncio.to_thread(job_store.progress, job["id"], len(chunks))
+            notify_job(job["id"])
+    except UpstreamError as e:
+        if retryable(e) and job["attempts"] + 1 < JOBS_MAX_ATTEMPTS:
+            # Full jitter, as for upstream retries, so a shed burst doesn't come back in lockstep
+            delay = random.uniform(0, min(JOBS_RETRY_MAX, JOBS_RETRY_BASE * 2 ** job["attempts"]))
+            await asyncio.to_thread(job_store.retry, job["id"], e.status_code, e.message, delay)
+        else:
+            await asyncio.to_thread(job_store.fail, job["id"], e.status_code, e.message)
+    else:
+        await asyncio.to_thread(job_store.complete, job["id"], seal_wav(b"".join(chunks)))
+    finally:
+        await remaining.aclose()
+    notify_job(job["id"])
+
+async def job_worker():
+    # Workers may be started from inside a request; don't charge their stages to it
+    request_metrics.set(None)
+    # Queued jobs share one lane of upstream capacity rather than their submitters'
+    request_client.set(("jobs", 1.0))
+    while True:
+        try:
+            job = await asyncio.to_thread(job_store.claim)
+        except sqlite3.Error as e:
+            logger.warning("Job queue unavailable: %s", e)
+            job = None
+        if job is None:
+            job_wakeup.clear()
+            try:
+                await asyncio.wait_for(job_wakeup.wait(), JOBS_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            await run_job(job)
+        except Exception as e:
+            logger.exception("Job %s failed", job["id"])
+            await asyncio.to_thread(job_store.fail, job["id"], 500, f"Error generating speech: {str(e)}")
+            notify_job(job["id"])
+
+def start_job_workers():
+    # Called from the lifespan, and lazily on submit in case the host skips lifespan events
+    global job_wakeup
+    if job_workers or JOBS_WORKERS <= 0:
+        return
+    job_wakeup = asyncio.Event()
+    for _ in range(JOBS_WORKERS):
+        job_workers.append(asyncio.ensure_future(job_worker()))
+
+async def stop_job_workers():
+    for task in job_workers:
+        task.cancel()
+    await asyncio.gather(*job_workers, return_exceptions=True)
+    job_workers.clear()
+
+def job_response(job, status_code=200):
+    body = {
+        "status": True,
+        "status_code": status_code,
+        "job": {
+            "id": job["id"],
+            "state": job["status"],
+            "voice": job["voice"],
+            "pitch": job["pitch"],
+            "speed": job["speed"],
+            "progress": job["pieces_done"] / job["pieces_total"] if job["pieces_total"] else 0.0,
+            "pieces_done": job["pieces_done"],
+            "pieces_total": job["pieces_total"],
+            "attempts": job["attempts"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+        },
+    }
+    if job["status"] == "done":
+        body["job"]["audio_url"] = f"/api/jobs/{job['id']}/audio"
+    if job["status"] == "failed":
+        body["job"]["error"] = {"status_code": job["error_code"], "message": job["error"]}
+    return JSONResponse(content=body, status_code=status_code, headers={"Location": f"/api/jobs/{job['id']}"})
+
+# Incremental synthesis over WebSocket
+STREAM_CONCURRENCY = int(os.environ.get("TTS_STREAM_CONCURRENCY", "2"))
+STREAM_MAX_PENDING = int(os.environ.get("TTS_STREAM_MAX_PENDING", "16"))
+
+class SentenceBuffer:
+    # Accumulates text fragments and hands back sentences as soon as they are complete
+
+    def __init__(self, max_length=MAX_TEXT_LENGTH):
+        self.max_length = max_length
+        self.text = ""
+
+    def push(self, fragment):
+        self.text += fragment
+        # A break needs the whitespace after the punctuation, so "3." waits to see if "14" follows
+        *sentences, self.text = SENTENCE_BREAK.split(self.text)
+        if len(self.text) > self.max_length:
+            *pieces, self.text = split_text(self.text, self.max_length)
+            sentences += pieces
+        return [sentence for sentence in (" ".join(sentence.split()) for sentence in sentences) if sentence]
+
+    def flush(self):
+        pieces = split_text(self.text, self.max_length)
+        self.text = ""
+        return pieces
+
+# Cache pre-warming
+WARMUP_ENABLED = os.environ.get("TTS_WARMUP", "0") == "1"
+WARMUP_MANIFEST = os.environ.get("TTS_WARMUP_MANIFEST", "")
+WARMUP_CONCURRENCY = int(os.environ.get("TTS_WARMUP_CONCURRENCY", "4"))
+DEMO_PHRASE = "This is a demonstration of the {voice} voice."
+
+warmup_progress = {"state": "disabled", "total": 0, "completed": 0, "cached": 0, "failed": 0}
+warmup_task = None
+
+def load_warmup_manifest(path):
+    # Entries are phrases for every voice, or objects with text and optional voice/pitch/speed/format
+    if path:
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+    else:
+        # The playground's "Try" buttons
+        entries = [{"text": DEMO_PHRASE}]
+    items = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"text": entry}
+        voices = [resolve_voice(entry["voice"])] if entry.get("voice") else AVAILABLE_VOICES
+        for voice in voices:
+            items.append((
+                voice,
+                entry["text"].replace("{voice}", voice),
+                int(entry.get("pitch", DEFAULT_PITCH)),
+                int(entry.get("speed", DEFAULT_SPEED)),
+                entry.get("format") or default_format(),
+            ))
+    return items
+
+async def warm_cache(items, concurrency=WARMUP_CONCURRENCY):
+    warmup_progress.update(state="running", total=len(items), completed=0, cached=0, failed=0, started_at=time.time())
+    semaphore = asyncio.Semaphore(concurrency)
+    request_client.set(("warmup", 1.0))
+
+    async def warm(voice, text, pitch, speed, audio_format):
+        async with semaphore:
+            error = validate_tts_params(voice, text, pitch, speed)
+            if error or audio_format not in available_formats():
+                logger.warning("Skipping warm-up entry %r for %r: %s", text, voice, error or f"format {audio_format} unavailable")
+                warmup_progress["failed"] += 1
+                return
+            # Keyed exactly as /api/tts will look it up
+            text, segments = prepare_text(text)
+            try:
+                chunks, _, cache_status = await open_synthesis(voice, text, pitch, speed, audio_format=audio_format, segments=segments)
+                async for _ in chunks:
+                    pass
+            except UpstreamError as e:
+                logger.warning("Warm-up of %r for %r failed: %s", text, voice, e.message)
+                warmup_progress["failed"] += 1
+                return
+            warmup_progress["completed"] += 1
+            if cache_status == "HIT":
+                warmup_progress["cached"] += 1
+
+    await asyncio.gather(*(warm(*item) for item in items))
+    warmup_progress.update(state="done", finished_at=time.time())
+
+def start_warmup():
+    # Runs in the background so the worker is ready while the cache fills
+    global warmup_task
+    if not (WARMUP_ENABLED or WARMUP_MANIFEST) or warmup_task is not None:
+        return
+    try:
+        items = load_warmup_manifest(WARMUP_MANIFEST)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning("Could not load warm-up manifest %r: %s", WARMUP_MANIFEST, e)
+        warmup_progress.update(state="failed", error=str(e))
+        return
+    warmup_progress["state"] = "pending"
+    warmup_task = asyncio.ensure_future(warm_cache(items))
+
+async def stop_warmup():
+    global warmup_task
+    if warmup_task is not None:
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
+        warmup_task = None
+
+def write_cache_snapshot(path):
+    # Bundles the in-memory cache and full-quality static variants for TTS_CACHE_SNAPSHOT
+    assets = [LANDING_PAGE, VOICES_RESPONSE, *STATIC_ASSETS.values()]
+    # Audio barely deflates, and stored entries are read without decompressing
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as archive:
+        for key, data in synthesis_cache.entries.items():
+            archive.writestr(f"audio/{key}", data)
+        for asset in assets:
+            archive.writestr(f"static/{asset.digest}.gzip", gzip.compress(asset.body, 9))
+            if brotli is not None:
+                archive.writestr(f"static/{asset.digest}.br", brotli.compress(asset.body, quality=11))
+    return len(synthesis_cache.entries), len(assets)
+
+# Landing page, rendered once at import from the voice registry and defaults
+LANDING_PAGE_TEMPLATE = """
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -225,18 +3235,16 @@ async def root():
                                         <span class="label-text font-bold text-lg">Select Voice</span>
                                     </label>
                                     <select class="select select-bordered select-lg" id="voiceSelect">
-                                        ${AVAILABLE_VOICES.map(voice => 
-                                            `<option value="${voice}" ${voice === DEFAULT_VOICE ? 'selected' : ''}>${voice}</option>`
-                                        ).join('')}
+                                        __VOICE_OPTIONS__
                                     </select>
                                 </div>
                                 
                                 <!-- Pitch Control -->
                                 <div class="form-control">
                                     <label class="label">
-                                        <span class="label-text font-bold text-lg">Pitch: <span id="pitchValue">${DEFAULT_PITCH}</span></span>
+                                        <span class="label-text font-bold text-lg">Pitch: <span id="pitchValue">__DEFAULT_PITCH__</span></span>
                                     </label>
-                                    <input type="range" min="50" max="250" value="${DEFAULT_PITCH}" class="range range-primary" id="pitchSlider" />
+                                    <input type="range" min="50" max="250" value="__DEFAULT_PITCH__" class="range range-primary" id="pitchSlider" />
                                     <div class="flex justify-between text-xs px-2 mt-1">
                                         <span>Low</span>
                                         <span>Normal</span>
@@ -247,9 +3255,9 @@ async def root():
                                 <!-- Speed Control -->
                                 <div class="form-control">
                                     <label class="label">
-                                        <span class="label-text font-bold text-lg">Speed: <span id="speedValue">${DEFAULT_SPEED}</span></span>
+                                        <span class="label-text font-bold text-lg">Speed: <span id="speedValue">__DEFAULT_SPEED__</span></span>
                                     </label>
-                                    <input type="range" min="50" max="250" value="${DEFAULT_SPEED}" class="range range-primary" id="speedSlider" />
+                                    <input type="range" min="50" max="250" value="__DEFAULT_SPEED__" class="range range-primary" id="speedSlider" />
                                     <div class="flex justify-between text-xs px-2 mt-1">
                                         <span>Slow</span>
                                         <span>Normal</span>
@@ -316,19 +3324,7 @@ async def root():
             
             <div class="max-w-6xl mx-auto">
                 <div class="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-4">
-                    ${AVAILABLE_VOICES.map(voice => `
-                        <div class="card bg-base-200 voice-option cursor-pointer" data-voice="${voice}">
-                            <div class="card-body py-4">
-                                <h3 class="card-title text-sm">${voice}</h3>
-                                <div class="card-actions justify-end">
-                                    <button class="btn btn-xs btn-outline try-voice" data-voice="${voice}">
-                                        <i data-lucide="play" class="w-3 h-3 mr-1"></i>
-                                        Try
-                                    </button>
-                                </div>
-                            </div>
-                        </div>
-                    `).join('')}
+                    __VOICE_CARDS__
                 </div>
             </div>
         </div>
@@ -445,12 +3441,18 @@ with open('audio.mp3', 'wb') as f:
 
     <!-- Lucide Icons -->
     <script src="https://unpkg.com/lucide@latest/dist/umd/lucide.js"></script>
-    <script>
+    <script src="__APP_SCRIPT_URL__"></script>
+</body>
+</html>
+"""
+
+LANDING_SCRIPT_TEMPLATE = """
         // Initialize Lucide icons
         lucide.createIcons();
         
-        // Available voices array
-        const AVAILABLE_VOICES = ${JSON.stringify(AVAILABLE_VOICES)};
+        // Voice catalog, the same entries /api/voices serves
+        const VOICE_CATALOG = __VOICE_CATALOG_JSON__;
+        const AVAILABLE_VOICES = VOICE_CATALOG.map(voice => voice.name);
         
         // Character counter
         const textInput = document.getElementById('textInput');
@@ -603,142 +3605,620 @@ with open('audio.mp3', 'wb') as f:
                 }
             });
         });
-    </script>
-</body>
-</html>
-    """
-    return HTMLResponse(content=html_content)
+"""
+
+VOICE_CARD_TEMPLATE = """                        <div class="card bg-base-200 voice-option cursor-pointer" data-voice="{voice}">
+                            <div class="card-body py-4">
+                                <h3 class="card-title text-sm">{voice}</h3>
+                                <div class="card-actions justify-end">
+                                    <button class="btn btn-xs btn-outline try-voice" data-voice="{voice}">
+                                        <i data-lucide="play" class="w-3 h-3 mr-1"></i>
+                                        Try
+                                    </button>
+                                </div>
+                            </div>
+                        </div>
+"""
+
+STATIC_MAX_AGE = 365 * 24 * 3600
+LANDING_PAGE_MAX_AGE = int(os.environ.get("TTS_LANDING_PAGE_MAX_AGE", "300"))
+# Quality 11 makes up most of the import time; serverless deploys lower it or bundle a snapshot
+STATIC_BROTLI_QUALITY = int(os.environ.get("TTS_STATIC_BROTLI_QUALITY", "11"))
+
+class StaticAsset:
+    # A body built once, with precomputed compressed variants and a strong ETag
+
+    def __init__(self, body, media_type, cache_control):
+        self.body = body
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()[:32]
+        self.encodings = {"gzip": self._bundled("gzip") or gzip.compress(body, 9)}
+        if brotli is not None:
+            self.encodings["br"] = self._bundled("br") or brotli.compress(body, quality=STATIC_BROTLI_QUALITY)
+
+    def _bundled(self, encoding):
+        # A snapshot carries variants compressed at full quality when it was built
+        return cache_snapshot.read(f"static/{self.digest}.{encoding}") if cache_snapshot else None
+
+    def response(self, request):
+        headers = {
+            "ETag": f'"{self.digest}"',
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(request.headers.get("if-none-match"), self.digest):
+            return Response(status_code=304, headers=headers)
+        encoding = choose_encoding(request.headers.get("accept-encoding"), self.encodings)
+        if encoding is None:
+            return Response(content=self.body, media_type=self.media_type, headers=headers)
+        headers["Content-Encoding"] = encoding
+        return Response(content=self.encodings[encoding], media_type=self.media_type, headers=headers)
+
+def choose_encoding(accept_encoding, available):
+    # Picks the smallest acceptable precomputed variant, or None for identity
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        name, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    candidates = [
+        encoding for encoding in available
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0
+    ]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda encoding: len(available[encoding]))
+
+def render_landing_page():
+    options = "".join(
+        f'<option value="{html.escape(voice)}"{" selected" if voice == DEFAULT_VOICE else ""}>{html.escape(voice)}</option>'
+        for voice in AVAILABLE_VOICES
+    )
+    cards = "".join(VOICE_CARD_TEMPLATE.format(voice=html.escape(voice)) for voice in AVAILABLE_VOICES)
+    # Escape "</" so a voice name can never close the script element
+    script = LANDING_SCRIPT_TEMPLATE.replace("__VOICE_CATALOG_JSON__", VOICE_CATALOG_JSON.replace("</", "<\\/"))
+    script_asset = StaticAsset(script.encode("utf-8"), "application/javascript", f"public, max-age={STATIC_MAX_AGE}, immutable")
+    script_name = f"app.{script_asset.digest[:12]}.js"
+    page = (
+        LANDING_PAGE_TEMPLATE
+        .replace("__VOICE_OPTIONS__", options)
+        .replace("__VOICE_CARDS__", cards)
+        .replace("__DEFAULT_PITCH__", str(DEFAULT_PITCH))
+        .replace("__DEFAULT_SPEED__", str(DEFAULT_SPEED))
+        .replace("__APP_SCRIPT_URL__", f"/static/{script_name}")
+    )
+    page_asset = StaticAsset(page.encode("utf-8"), "text/html", f"public, max-age={LANDING_PAGE_MAX_AGE}")
+    return page_asset, {script_name: script_asset}
+
+LANDING_PAGE, STATIC_ASSETS = render_landing_page()
+
+@app.get("/")
+async def root(request: Request):
+    return LANDING_PAGE.response(request)
+
+@app.get("/static/{name}")
+async def static_asset(request: Request, name: str):
+    asset = STATIC_ASSETS.get(name)
+    if asset is None:
+        return error_response(404, "Endpoint not found")
+    return asset.response(request)
 
 @app.get("/api/tts")
-async def text_to_speech_api(voice: str = "", text: str = "", pitch: int = 150, speed: int = 150):
-    if not voice or not text or voice.strip() == "" or text.strip() == "":
-        return JSONResponse(
-            content={
-                "status": False,
-                "status_code": 400,
-                "message": "Voice and text parameters are required"
-            },
-            status_code=400
-        )
+async def text_to_speech_api(
+    request: Request,
+    voice: str = "",
+    text: str = "",
+    pitch: int = 150,
+    speed: int = 150,
+    format: str = "",
+    normalize: str = "",
+    trim: bool = False,
+    sample_rate: int = 0,
+    channels: int = 0
+):
+    return await serve_tts(request, voice, text, pitch, speed, format, normalize, trim, sample_rate, channels)
+
+TTS_BODY_FIELDS = {
+    "voice": str,
+    "text": str,
+    "pitch": int,
+    "speed": int,
+    "format": str,
+    "normalize": str,
+    "trim": bool,
+    "sample_rate": int,
+    "channels": int,
+    "ssml": bool,
+}
+TTS_BODY_DEFAULTS = {"voice": "", "text": "", "pitch": DEFAULT_PITCH, "speed": DEFAULT_SPEED, "format": "", "normalize": "", "trim": False, "sample_rate": 0, "channels": 0, "ssml": False}
+MAX_BODY_BYTES = int(os.environ.get("TTS_MAX_BODY_BYTES", str(1024 * 1024)))
+
+async def read_tts_body(request):
+    # Returns (fields, None) from a JSON, form or plain-text/SSML body, or (None, error response)
+    body = b""
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_BODY_BYTES:
+            return None, error_response(413, f"Request bodies are limited to {MAX_BODY_BYTES} bytes")
+    encoding = request.headers.get("content-encoding", "identity").strip().lower()
+    if encoding == "gzip":
+        # Bounded, so a small compressed body can't expand without limit
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(body, MAX_BODY_BYTES)
+        except zlib.error:
+            return None, error_response(400, "Request body is not valid gzip")
+        if decompressor.unconsumed_tail:
+            return None, error_response(413, f"Request bodies are limited to {MAX_BODY_BYTES} bytes")
+    elif encoding != "identity":
+        return None, error_response(415, "Content-Encoding must be gzip or identity")
     
-    # Validate text length
-    if len(text) > 1000:
-        return JSONResponse(
-            content={
-                "status": False,
-                "status_code": 400,
-                "message": "Text must be 1000 characters or less"
-            },
-            status_code=400
-        )
+    # Query parameters fill in anything the body leaves out, e.g. voice for a bare SSML body
+    fields = dict(request.query_params)
+    media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if media_type == "application/json":
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return None, error_response(400, "Request body is not valid JSON")
+        if not isinstance(data, dict):
+            return None, error_response(400, "Request body must be a JSON object")
+        fields.update(data)
+    elif media_type in ("application/x-www-form-urlencoded", "multipart/form-data"):
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+        try:
+            form = await Request(request.scope, receive).form()
+        except Exception:
+            return None, error_response(400, "Request body is not a valid form")
+        fields.update({name: value for name, value in form.items() if isinstance(value, str)})
+    elif media_type in ("text/plain", "application/ssml+xml", "application/xml"):
+        try:
+            fields["text"] = body.decode("utf-8")
+        except UnicodeDecodeError:
+            return None, error_response(400, "Request body must be UTF-8 text")
+        fields["ssml"] = fields.get("ssml") or media_type != "text/plain"
+    else:
+        return None, error_response(415, "Content-Type must be JSON, a form, plain text or SSML")
     
-    # Validate voice
-    if voice not in AVAILABLE_VOICES:
-        return JSONResponse(
-            content={
-                "status": False,
-                "status_code": 400,
-                "message": f"Voice '{voice}' is not available. Please use one of the supported voices."
-            },
-            status_code=400
-        )
+    parsed = dict(TTS_BODY_DEFAULTS)
+    for name, kind in TTS_BODY_FIELDS.items():
+        value = fields.get(name)
+        if value is None or value == "":
+            continue
+        if kind is bool:
+            parsed[name] = value if isinstance(value, bool) else str(value).strip().lower() in ("1", "true", "yes", "on")
+        elif kind is int:
+            try:
+                parsed[name] = int(value)
+            except (TypeError, ValueError):
+                return None, error_response(400, f"{name.replace('_', ' ').capitalize()} must be an integer")
+        elif not isinstance(value, str):
+            return None, error_response(400, f"{name.replace('_', ' ').capitalize()} must be a string")
+        else:
+            parsed[name] = value
+    return parsed, None
+
+@app.post("/api/tts")
+async def text_to_speech_post_api(request: Request):
+    # Same as GET, with the parameters in a (optionally gzipped) JSON, form, text or SSML body
+    fields, error = await read_tts_body(request)
+    if error:
+        return error
+    voice, text, pitch, speed = fields["voice"], fields["text"], fields["pitch"], fields["speed"]
+    if fields["ssml"] or text.lstrip().startswith("<speak"):
+        voice, pitch, speed = ssml_settings(text, voice, pitch, speed)
+        text = " ".join(strip_ssml(text).split())
+    return await serve_tts(
+        request, voice, text, pitch, speed,
+        fields["format"], fields["normalize"], fields["trim"], fields["sample_rate"], fields["channels"]
+    )
+
+async def serve_tts(request, voice, text, pitch, speed, format, normalize, trim, sample_rate, channels):
+    voice = resolve_voice(voice)
+    set_request_voice(voice)
+    limited = await rate_limiter.admit(request)
+    if limited:
+        return limited
+    with timed("validate"):
+        error = validate_tts_params(voice, text, pitch, speed)
+        audio_format = negotiate_format(format, request.headers.get("accept"))
+        processing, processing_error = processing_spec(normalize, trim, sample_rate, channels)
+    if error or processing_error:
+        return error_response(400, error or processing_error)
     
-    # Validate pitch and speed ranges
-    if pitch < 50 or pitch > 250 or speed < 50 or speed > 250:
-        return JSONResponse(
-            content={
-                "status": False,
-                "status_code": 400,
-                "message": "Pitch and speed must be between 50 and 250"
-            },
-            status_code=400
-        )
+    if audio_format not in AUDIO_FORMATS:
+        return error_response(400, f"Format must be one of: {', '.join(AUDIO_FORMATS)}")
+    if audio_format not in available_formats():
+        return error_response(406, f"Format '{audio_format}' is not available on this server")
+    
+    with timed("normalize"):
+        text, segments = prepare_text(text)
+    if not text:
+        return error_response(400, "Voice and text parameters are required")
+    key = synthesis_key(voice, text, pitch, speed)
+    variant = variant_key(key, audio_format, processing)
+    headers = audio_headers(variant, voice, pitch, speed, audio_format)
+    if not format:
+        headers["Vary"] = "Accept"
+    
+    # The ETag is derived from the parameters, so revalidation needs no lookup
+    if etag_matches(request.headers.get("if-none-match"), variant):
+        return Response(status_code=304, headers=headers)
+    
+    # Seeks and resumed downloads are served from the whole (usually cached) clip
+    if request.headers.get("range"):
+        try:
+            chunks, _, cache_status = await open_synthesis(voice, text, pitch, speed, key, audio_format, segments, processing)
+            audio_content = b"".join([chunk async for chunk in chunks])
+        except UpstreamError as e:
+            return error_response(e.status_code, e.message)
+        if cache_status != "HIT" and is_spliced(audio_format, segments, processing):
+            # Byte ranges must index the same bytes the strong ETag names, which is the cached body
+            audio_content = seal_wav(audio_content)
+        record_cache_lookup("request", cache_status)
+        headers["X-Cache"] = cache_status
+        return ranged_response(request, audio_content, AUDIO_FORMATS[audio_format][0], headers)
     
     try:
-        # Encode parameters for URL
-        encoded_voice = urllib.parse.quote(voice)
-        encoded_text = urllib.parse.quote(text)
-        
-        # Build Tetyys API URL
-        tetyys_url = f"https://www.tetyys.com/SAPI4/SAPI4?text={encoded_text}&voice={encoded_voice}&pitch={pitch}&speed={speed}"
-        
-        # Make request to Tetyys API
-        response = requests.get(tetyys_url, timeout=30)
-        
-        if response.status_code == 200:
-            # Get the audio content
-            audio_content = response.content
-            
-            # Create in-memory file-like object
-            audio_buffer = io.BytesIO(audio_content)
-            
-            return StreamingResponse(
-                audio_buffer,
-                media_type="audio/mpeg",
-                headers={
-                    "Content-Disposition": "inline; filename=voicecraft-audio.mp3",
-                    "X-Generated-By": "VoiceCraft Pro",
-                    "X-Voice-Used": voice,
-                    "X-Pitch": str(pitch),
-                    "X-Speed": str(speed)
-                }
-            )
-        else:
-            return JSONResponse(
-                content={
-                    "status": False,
-                    "status_code": response.status_code,
-                    "message": f"TTS service returned error: {response.status_code}"
-                },
-                status_code=response.status_code
-            )
-        
-    except requests.exceptions.Timeout:
-        return JSONResponse(
-            content={
-                "status": False,
-                "status_code": 408,
-                "message": "TTS service timeout"
-            },
-            status_code=408
-        )
-    except Exception as e:
-        return JSONResponse(
-            content={
-                "status": False,
-                "status_code": 500,
-                "message": f"Error generating speech: {str(e)}"
-            },
-            status_code=500
+        chunks, content_length, cache_status = await open_synthesis(voice, text, pitch, speed, key, audio_format, segments, processing)
+    except UpstreamError as e:
+        return error_response(e.status_code, e.message)
+    
+    record_cache_lookup("request", cache_status)
+    headers["X-Cache"] = cache_status
+    if cache_status != "HIT" and is_spliced(audio_format, segments, processing):
+        # The placeholder header differs from the cached body's, so these bytes only get a weak validator
+        headers["ETag"] = f"W/{headers['ETag']}"
+    headers["Accept-Ranges"] = "bytes"
+    if content_length is not None:
+        headers["Content-Length"] = str(content_length)
+    return StreamingResponse(relay_audio(chunks, variant), media_type=AUDIO_FORMATS[audio_format][0], headers=headers)
+
+@app.get("/api/tts/marks")
+async def text_to_speech_marks_api(request: Request, voice: str = "", text: str = "", pitch: int = 150, speed: int = 150, format: str = "json"):
+    # Word timings for the WAV /api/tts returns for the same parameters, as JSON or WebVTT
+    voice = resolve_voice(voice)
+    set_request_voice(voice)
+    limited = await rate_limiter.admit(request)
+    if limited:
+        return limited
+    error = validate_tts_params(voice, text, pitch, speed)
+    if error:
+        return error_response(400, error)
+    if format not in ("json", "vtt"):
+        return error_response(400, "Format must be 'json' or 'vtt'")
+    if not NUMPY_AVAILABLE:
+        return error_response(406, "Timing marks are not available on this server")
+    
+    source = text
+    text, segments = prepare_text(text)
+    if not text:
+        return error_response(400, "Voice and text parameters are required")
+    key = synthesis_key(voice, text, pitch, speed)
+    # Marks show the words as written, so requests that only sound alike get their own
+    marks_key = f"{key}-marks-{hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]}"
+    headers = {"ETag": f'"{marks_key}"', "Cache-Control": f"public, max-age={CACHE_MAX_AGE}", "X-Generated-By": "VoiceCraft Pro"}
+    if etag_matches(request.headers.get("if-none-match"), marks_key):
+        return Response(status_code=304, headers=headers)
+    
+    # Marks are cached next to the audio, so alignment runs once per unique clip
+    body = await synthesis_cache.get(marks_key)
+    headers["X-Cache"] = "HIT" if body is not None else "MISS"
+    if body is None:
+        try:
+            with timed("align"):
+                marks = await compute_marks(voice, text, pitch, speed, key, segments, source)
+        except UpstreamError as e:
+            return error_response(e.status_code, e.message)
+        body = json.dumps(marks, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        await synthesis_cache.set(marks_key, body)
+    if format == "vtt":
+        return Response(content=marks_to_vtt(json.loads(body)), media_type="text/vtt", headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+class TTSRequest(BaseModel):
+    voice: str = ""
+    text: str = ""
+    pitch: int = DEFAULT_PITCH
+    speed: int = DEFAULT_SPEED
+
+class BatchRequest(BaseModel):
+    items: list[TTSRequest] = []
+    format: str = "ndjson"
+
+@app.post("/api/tts/long")
+async def long_text_to_speech_api(request: Request, body: TTSRequest):
+    voice, text, pitch, speed = resolve_voice(body.voice), body.text, body.pitch, body.speed
+    set_request_voice(voice)
+    with timed("validate"):
+        error = validate_tts_params(voice, text, pitch, speed, max_length=LONG_TEXT_MAX_LENGTH)
+    if error:
+        return error_response(400, error)
+    with timed("normalize"):
+        text = prepare_text(text)[0]
+    pieces = split_text(text)
+    if not pieces:
+        return error_response(400, "Voice and text parameters are required")
+    
+    # Long texts cost one token per upstream piece
+    limited = await rate_limiter.admit(request, len(pieces))
+    if limited:
+        return limited
+    
+    key = synthesis_key(voice, text, pitch, speed)
+    if etag_matches(request.headers.get("if-none-match"), key):
+        return Response(status_code=304, headers=audio_headers(key, voice, pitch, speed, "wav"))
+    
+    # Upstream errors on the first piece can still be reported as JSON
+    remaining = synthesize_pieces(voice, pieces, pitch, speed)
+    try:
+        fmt, pcm = parse_wav(await remaining.__anext__())
+    except UpstreamError as e:
+        await remaining.aclose()
+        return error_response(e.status_code, e.message)
+    except ValueError as e:
+        await remaining.aclose()
+        return error_response(502, f"TTS service returned invalid audio: {str(e)}")
+    
+    headers = audio_headers(key, voice, pitch, speed, "wav")
+    headers["X-Chunks"] = str(len(pieces))
+    return StreamingResponse(relay_audio(stitch_wav(fmt, pcm, remaining), key), media_type="audio/wav", headers=headers)
+
+@app.websocket("/api/tts/stream")
+async def text_to_speech_stream(websocket: WebSocket, voice: str = "", pitch: int = 150, speed: int = 150, format: str = ""):
+    # Clients send {"text": fragment} frames ({"flush": true} / {"end": true} to force the tail out);
+    # each sentence comes back as an {"type": "audio"} frame followed by a binary frame with its clip
+    await websocket.accept()
+    voice = resolve_voice(voice)
+    # Text arrives later, so check everything else up front
+    error = validate_tts_params(voice, "-", pitch, speed)
+    audio_format = negotiate_format(format, None)
+    if not error and audio_format not in AUDIO_FORMATS:
+        error = f"Format must be one of: {', '.join(AUDIO_FORMATS)}"
+    elif not error and audio_format not in available_formats():
+        error = f"Format '{audio_format}' is not available on this server"
+    if error:
+        await websocket.send_json({"type": "error", "status_code": 400, "message": error})
+        await websocket.close(code=1008)
+        return
+    
+    semaphore = asyncio.Semaphore(STREAM_CONCURRENCY)
+    pending = asyncio.Queue(maxsize=STREAM_MAX_PENDING)
+    tasks = []
+    
+    async def synthesize_sentence(sentence):
+        retry_after = await rate_limiter.check(websocket)
+        if retry_after:
+            raise UpstreamError(429, f"Too many requests. Retry after {math.ceil(retry_after)} seconds.")
+        text, segments = prepare_text(sentence)
+        if not text:
+            raise UpstreamError(400, "Nothing to synthesize in this sentence")
+        async with semaphore:
+            chunks, _, cache_status = await open_synthesis(voice, text, pitch, speed, audio_format=audio_format, segments=segments)
+            return b"".join([chunk async for chunk in chunks]), cache_status
+    
+    async def send_results():
+        # Sentences synthesize in parallel but go out in the order they were written
+        index = 0
+        while (item := await pending.get()) is not None:
+            sentence, task = item
+            try:
+                audio, cache_status = await task
+            except UpstreamError as e:
+                await websocket.send_json({"type": "error", "index": index, "text": sentence, "status_code": e.status_code, "message": e.message})
+            else:
+                await websocket.send_json({
+                    "type": "audio",
+                    "index": index,
+                    "text": sentence,
+                    "format": audio_format,
+                    "media_type": AUDIO_FORMATS[audio_format][0],
+                    "bytes": len(audio),
+                    "cache": cache_status
+                })
+                await websocket.send_bytes(audio)
+            index += 1
+        await websocket.send_json({"type": "done", "sentences": index})
+    
+    sender = asyncio.ensure_future(send_results())
+    
+    async def enqueue(item):
+        # Blocks once the client is far enough ahead, which stops reading from the socket;
+        # returns False if the sender has stopped, which only happens when the connection is gone
+        queued = asyncio.ensure_future(pending.put(item))
+        await asyncio.wait({queued, sender}, return_when=asyncio.FIRST_COMPLETED)
+        if queued.done():
+            return True
+        queued.cancel()
+        logger.info("WebSocket stream ended early: %r", sender.exception())
+        return False
+    
+    buffer = SentenceBuffer()
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            raw = frame.get("text")
+            if raw is None:
+                # 1003: this endpoint only takes text frames
+                await websocket.send_json({"type": "error", "status_code": 400, "message": "Binary frames are not supported; send text frames"})
+                await websocket.close(code=1003)
+                return
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                message = None
+            # Anything that isn't a JSON object is taken as a bare text fragment
+            if not isinstance(message, dict):
+                message = {"text": raw}
+            sentences = buffer.push(str(message.get("text") or ""))
+            if message.get("flush") or message.get("end"):
+                sentences += buffer.flush()
+            for sentence in sentences:
+                tasks.append(asyncio.ensure_future(synthesize_sentence(sentence)))
+                if not await enqueue((sentence, tasks[-1])):
+                    return
+            if message.get("end"):
+                break
+        if await enqueue(None):
+            await asyncio.wait({sender})
+            if sender.exception() is None:
+                await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(sender, *tasks, return_exceptions=True)
+
+@app.post("/api/tts/batch")
+async def batch_text_to_speech_api(request: Request, body: BatchRequest):
+    if not body.items:
+        return error_response(400, "At least one item is required")
+    if len(body.items) > BATCH_MAX_ITEMS:
+        return error_response(400, f"Batches are limited to {BATCH_MAX_ITEMS} items")
+    if body.format not in ("ndjson", "zip"):
+        return error_response(400, "Format must be 'ndjson' or 'zip'")
+    limited = await rate_limiter.admit(request, len(body.items))
+    if limited:
+        return limited
+    
+    results = synthesize_batch(body.items)
+    if body.format == "zip":
+        return StreamingResponse(
+            stream_batch_zip(results),
+            media_type="application/zip",
+            headers={"Content-Disposition": "attachment; filename=voicecraft-batch.zip", "X-Generated-By": "VoiceCraft Pro"}
         )
+    return StreamingResponse(stream_batch_ndjson(results), media_type="application/x-ndjson", headers={"X-Generated-By": "VoiceCraft Pro"})
+
+@app.post("/api/jobs")
+async def create_job_api(request: Request, body: TTSRequest):
+    voice, text, pitch, speed = resolve_voice(body.voice), body.text, body.pitch, body.speed
+    error = validate_tts_params(voice, text, pitch, speed, max_length=LONG_TEXT_MAX_LENGTH)
+    if error:
+        return error_response(400, error)
+    
+    # Stored normalized, so the job's pieces share cache entries with /api/tts
+    text = prepare_text(text)[0]
+    pieces = split_text(text)
+    if not pieces:
+        return error_response(400, "Voice and text parameters are required")
+    limited = await rate_limiter.admit(request, len(pieces))
+    if limited:
+        return limited
+    key = synthesis_key(voice, text, pitch, speed)
+    job, created = await asyncio.to_thread(job_store.submit, key, voice, text, pitch, speed, len(pieces))
+    start_job_workers()
+    if created and job_wakeup is not None:
+        job_wakeup.set()
+    return job_response(job, 202 if job["status"] != "done" else 200)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_api(job_id: str, wait: float = 0):
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        return error_response(404, "Job not found")
+    
+    # Long-poll until the job changes state, progresses or the wait runs out
+    deadline = time.monotonic() + min(max(wait, 0), JOBS_MAX_WAIT)
+    seen = (job["status"], job["pieces_done"])
+    while job["status"] in ("queued", "running") and (job["status"], job["pieces_done"]) == seen:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        event = job_events.setdefault(job_id, asyncio.Event())
+        try:
+            # Poll as well, since another worker process may be running the job
+            await asyncio.wait_for(event.wait(), min(remaining, JOBS_POLL_INTERVAL))
+        except asyncio.TimeoutError:
+            pass
+        job = await asyncio.to_thread(job_store.get, job_id)
+    if job["status"] not in ("queued", "running"):
+        job_events.pop(job_id, None)
+    return job_response(job)
+
+@app.get("/api/jobs/{job_id}/audio")
+async def get_job_audio_api(request: Request, job_id: str):
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        return error_response(404, "Job not found")
+    if job["status"] != "done":
+        return error_response(409, f"Job is {job['status']}")
+    
+    headers = audio_headers(job["key"], job["voice"], job["pitch"], job["speed"], "wav")
+    if etag_matches(request.headers.get("if-none-match"), job["key"]):
+        return Response(status_code=304, headers=headers)
+    audio = await asyncio.to_thread(job_store.get_audio, job_id)
+    return ranged_response(request, audio, "audio/wav", headers)
+
+VOICES_RESPONSE = StaticAsset(
+    json.dumps(voice_catalog.body(voice_catalog.entries), ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+    "application/json",
+    f"public, max-age={LANDING_PAGE_MAX_AGE}",
+)
 
 @app.get("/api/voices")
-async def list_voices_api():
+async def list_voices_api(
+    request: Request,
+    engine: str = "",
+    family: str = "",
+    language: str = "",
+    effect: str = "",
+    gender: str = "",
+    q: str = "",
+    offset: int = 0,
+    limit: int = 0
+):
+    # The unfiltered list is the common case and is served precomputed
+    if not (engine or family or language or effect or gender or q or offset or limit):
+        return VOICES_RESPONSE.response(request)
+    if offset < 0 or not 0 <= limit <= VOICES_PAGE_MAX:
+        return error_response(400, f"Offset must be 0 or more and limit between 0 and {VOICES_PAGE_MAX} (0 = all)")
+    matches = voice_catalog.filter(engine, family, language, effect, gender, q)
+    page = matches[offset:offset + limit] if limit else matches[offset:]
     return JSONResponse(
-        content={
-            "status": True,
-            "status_code": 200,
-            "voices": AVAILABLE_VOICES,
-            "total_voices": len(AVAILABLE_VOICES),
-            "default_voice": DEFAULT_VOICE,
-            "default_pitch": DEFAULT_PITCH,
-            "default_speed": DEFAULT_SPEED
-        }
+        content=voice_catalog.body(page, total_voices=len(matches), offset=offset, limit=limit or len(matches)),
+        headers={"Cache-Control": f"public, max-age={LANDING_PAGE_MAX_AGE}"}
     )
 
+HEALTH_INFO = {
+    "status": True,
+    "status_code": 200,
+    "message": "VoiceCraft Pro is healthy",
+    "version": "1.0.0",
+    "service": "SAPI4 TTS API",
+    "features": ["Free", "Unlimited", "MP3 Output", "30+ Voices", "Customizable"],
+}
+
 @app.get("/api/health")
 async def health_check():
     return JSONResponse(
         content={
-            "status": True,
-            "status_code": 200,
-            "message": "VoiceCraft Pro is healthy",
-            "version": "1.0.0",
-            "service": "SAPI4 TTS API",
-            "features": ["Free", "Unlimited", "MP3 Output", "30+ Voices", "Customizable"]
+            **HEALTH_INFO,
+            "cache": {**synthesis_cache.stats(), "lookups": cache_hit_ratios()},
+            "coalescing": upstream_flights.stats(),
+            "backends": [backend.stats() for backend in synthesis_backends],
+            "warmup": warmup_progress,
+            "rate_limit": rate_limiter.stats()
         }
     )
 
+@app.get("/metrics")
+async def metrics_api():
+    return PlainTextResponse(metrics_text(), media_type="text/plain; version=0.0.4")
+
 # Error handlers
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+import main
+
+
+def adaptive(initial=4, min_limit=2, max_limit=8, max_queued=100, timeout=5):
+    queue = main.FairQueue(max_limit, max_queued=max_queued, timeout=timeout)
+    return main.AdaptiveLimit(queue, initial, min_limit, max_limit, tolerance=2.0, backoff=0.9)
+
+
+def test_limit_grows_while_in_use(clock):
+    limit = adaptive()
+    limit.queue.active = 4
+    for _ in range(5):
+        limit.observe(0.1)
+    # About one slot per limit's worth of fast round trips
+    assert limit.limit == pytest.approx(5.12, abs=0.01)
+    assert limit.queue.limit == 5
+
+
+def test_limit_holds_while_lightly_used(clock):
+    limit = adaptive()
+    limit.queue.active = 1
+    for _ in range(20):
+        limit.observe(0.1)
+    assert limit.limit == 4
+
+
+def test_limit_stops_at_max(clock):
+    limit = adaptive(initial=8)
+    limit.queue.active = 8
+    for _ in range(20):
+        limit.observe(0.1)
+    assert limit.limit == 8
+
+
+def test_slow_round_trip_cuts_limit(clock):
+    limit = adaptive()
+    limit.observe(0.1)
+    limit.observe(0.5)
+    assert limit.limit == pytest.approx(3.6)
+    assert limit.queue.limit == 3
+
+
+def test_dropped_round_trip_cuts_limit(clock):
+    limit = adaptive()
+    limit.observe(0.1, dropped=True)
+    assert limit.limit == pytest.approx(3.6)
+    # A dropped call says nothing about latency, so it never becomes the baseline
+    assert not limit.samples
+
+
+def test_one_cut_per_round_trip(clock):
+    limit = adaptive()
+    limit.observe(0.1)
+    for _ in range(5):
+        limit.observe(0.5)
+    assert limit.limit == pytest.approx(3.6)
+    clock.advance(0.4)
+    limit.observe(0.5)
+    assert limit.limit == pytest.approx(3.6)
+    clock.advance(0.1)
+    limit.observe(0.5)
+    assert limit.limit == pytest.approx(3.24)
+
+
+def test_limit_never_drops_below_min(clock):
+    limit = adaptive()
+    for _ in range(20):
+        clock.advance(1)
+        limit.observe(0.1, dropped=True)
+    assert limit.limit == 2
+    assert limit.queue.limit == 2
+
+
+def test_shrunk_limit_sheds_when_queue_is_full(clock):
+    limit = adaptive(initial=2, max_queued=1)
+
+    async def run():
+        await limit.queue.acquire("a")
+        await limit.queue.acquire("b")
+        waiting = asyncio.create_task(limit.queue.acquire("c"))
+        await asyncio.sleep(0)
+        with pytest.raises(main.UpstreamError) as raised:
+            await limit.queue.acquire("d")
+        limit.queue.release()
+        await waiting
+        return raised.value.status_code
+
+    assert asyncio.run(run()) == 503
+    assert limit.queue.shed == 1
+
+
+def test_shrunk_limit_times_out_queued_requests(clock):
+    limit = adaptive(initial=3, timeout=0.01)
+
+    async def run():
+        for client in ("a", "b", "c"):
+            await limit.queue.acquire(client)
+        limit.observe(0.1, dropped=True)
+        # The cut leaves the three calls in flight over the new limit of 2
+        limit.queue.release()
+        with pytest.raises(main.UpstreamError) as raised:
+            await limit.queue.acquire("d")
+        return raised.value.status_code
+
+    assert asyncio.run(run()) == 503
+    assert limit.queue.limit == 2
+    assert limit.queue.shed == 1
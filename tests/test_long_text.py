@@ -0,0 +1,100 @@
+import asyncio
+import struct
+
+import pytest
+
+import main
+
+FMT = struct.pack("<HHIIHH", 1, 1, 22050, 44100, 2, 16)
+OTHER_FMT = struct.pack("<HHIIHH", 1, 1, 11025, 22050, 2, 16)
+
+
+def wav(pcm, fmt=FMT):
+    return main.wav_header(fmt, len(pcm)) + pcm
+
+
+def test_split_packs_whole_sentences():
+    text = "One two. Three four. Five six."
+    assert main.split_text(text, max_length=20) == ["One two. Three four.", "Five six."]
+    assert main.split_text(text, max_length=1000) == [text]
+
+
+def test_split_falls_back_to_clauses():
+    text = "alpha beta gamma, delta epsilon zeta; eta theta"
+    assert main.split_text(text, max_length=20) == ["alpha beta gamma,", "delta epsilon zeta;", "eta theta"]
+
+
+def test_split_falls_back_to_words():
+    pieces = main.split_text("aaaa bbbb cccc dddd eeee", max_length=10)
+    assert pieces == ["aaaa bbbb", "cccc dddd", "eeee"]
+
+
+def test_split_hard_cuts_unbroken_text():
+    assert main.split_text("x" * 25, max_length=10) == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_split_keeps_every_word_within_the_limit():
+    text = " ".join(f"Sentence number {i} has, several clauses; and words." for i in range(50))
+    pieces = main.split_text(text, max_length=64)
+    assert all(len(piece) <= 64 for piece in pieces)
+    assert " ".join(pieces).split() == text.split()
+
+
+def test_split_drops_blank_text():
+    assert main.split_text("   \n  ") == []
+
+
+def test_streamed_header_uses_placeholder_sizes():
+    header = main.wav_header(FMT)
+    assert header[4:8] == b"\xff\xff\xff\xff"
+    assert header[-4:] == b"\xff\xff\xff\xff"
+    fmt, pcm = main.parse_wav(header + b"\x01\x00\x02\x00")
+    assert fmt == FMT and pcm == b"\x01\x00\x02\x00"
+
+
+def test_sized_header_matches_data():
+    data = wav(b"\x00\x01" * 10)
+    assert int.from_bytes(data[4:8], "little") == len(data) - 8
+    assert int.from_bytes(data[-24:-20], "little") == 20
+
+
+async def pieces(*items):
+    for item in items:
+        yield item
+
+
+def collect(generator):
+    async def run():
+        return [chunk async for chunk in generator]
+    return asyncio.run(run())
+
+
+def test_stitch_puts_one_header_before_all_pcm():
+    chunks = collect(main.stitch_wav(FMT, b"\x01\x00", pieces(wav(b"\x02\x00"), wav(b"\x03\x00"))))
+    assert chunks[0] == main.wav_header(FMT) + b"\x01\x00"
+    assert chunks[1:] == [b"\x02\x00", b"\x03\x00"]
+    assert main.parse_wav(b"".join(chunks))[1] == b"\x01\x00\x02\x00\x03\x00"
+
+
+def test_stitch_aborts_on_format_mismatch_and_closes_the_source():
+    closed = []
+
+    async def source():
+        try:
+            yield wav(b"\x02\x00")
+            yield wav(b"\x03\x00", OTHER_FMT)
+            yield wav(b"\x04\x00")
+        finally:
+            closed.append(True)
+
+    with pytest.raises(main.UpstreamError) as raised:
+        collect(main.stitch_wav(FMT, b"\x01\x00", source()))
+    assert raised.value.status_code == 502
+    assert "mismatched" in raised.value.message
+    assert closed == [True]
+
+
+def test_stitch_rejects_invalid_audio():
+    with pytest.raises(main.UpstreamError) as raised:
+        collect(main.stitch_wav(FMT, b"", pieces(b"not a wav")))
+    assert raised.value.status_code == 502
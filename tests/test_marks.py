@@ -0,0 +1,105 @@
+import asyncio
+import math
+import struct
+
+import pytest
+
+import main
+
+np = pytest.importorskip("numpy")
+
+
+def speech_wav(text, sample_rate=11025):
+    # A tone burst per word, as long as the word, with a short gap after each
+    parts = []
+    for word in text.split():
+        t = np.arange(int(sample_rate * 0.05 * len(word))) / sample_rate
+        parts += [0.5 * np.sin(2 * math.pi * 300 * t), np.zeros(int(sample_rate * 0.05))]
+    pcm = np.rint(np.concatenate(parts) * 32767).astype("<i2").tobytes()
+    fmt = struct.pack("<HHIIHH", 1, 1, sample_rate, sample_rate * 2, 2, 16)
+    return main.wav_header(fmt, len(pcm)) + pcm
+
+
+@pytest.fixture
+def synthesized(monkeypatch):
+    spoken = []
+
+    async def open_synthesis(voice, text, pitch, speed, *args, **kwargs):
+        spoken.append(text)
+        data = speech_wav(text)
+
+        async def chunks():
+            yield data
+
+        return chunks(), len(data), "MISS"
+
+    monkeypatch.setattr(main, "open_synthesis", open_synthesis)
+    return spoken
+
+
+def marks_for(source):
+    text, segments = main.prepare_text(source)
+    return asyncio.run(main.compute_marks("Sam", text, 150, 100, "key", segments, source))
+
+
+def test_spoken_words_map_back_to_source():
+    source = "Dr. Smith paid $3."
+    assert [(word, source[start:end]) for word, start, end in main.spoken_words(source)] == [
+        ("Doctor", "Dr."), ("Smith", "Smith"), ("paid", "paid"), ("three", "$3"), ("dollars.", "$3."),
+    ]
+
+
+def test_spoken_words_match_normalized_text():
+    source = '<speak>It cost £2.50 on the 3rd, i.e. <sub alias="World Wide Web">WWW</sub> day &amp; night</speak>'
+    assert " ".join(word for word, _, _ in main.spoken_words(source)) == main.normalize_text(source)
+
+
+def test_marks_show_source_words(synthesized):
+    marks = marks_for("Dr. Smith paid $3.")
+    assert synthesized == ["Doctor Smith paid three dollars."]
+    assert [(word["word"], word["spoken"]) for word in marks["words"]] == [
+        ("Dr.", "Doctor"), ("Smith", "Smith"), ("paid", "paid"), ("$3", "three dollars"),
+    ]
+    assert marks["sentences"][0]["text"] == "Dr. Smith paid $3."
+    assert marks["sentences"][0]["spoken"] == "Doctor Smith paid three dollars."
+
+
+def test_merged_mark_spans_its_spoken_words(synthesized):
+    words = marks_for("Pay $1.5 million now")["words"]
+    assert [word["word"] for word in words] == ["Pay", "$1.5 million", "now"]
+    assert words[1]["spoken"] == "one point five million dollars"
+    assert words[0]["end"] <= words[1]["start"] < words[1]["end"] <= words[2]["start"]
+
+
+def test_marks_show_markup_free_text(synthesized):
+    marks = marks_for('<speak>Visit <sub alias="World Wide Web">WWW</sub> for (5) e.g. AT&amp;T</speak>')
+    assert [(word["word"], word["spoken"]) for word in marks["words"]] == [
+        ("Visit", "Visit"), ("WWW", "World Wide Web"), ("for", "for"), ("5", "five"), ("e.g.", "for example"), ("AT&T", "AT&T"),
+    ]
+    assert marks["sentences"][0]["text"] == "Visit WWW for (5) e.g. AT&T"
+
+
+def test_marks_follow_segments(synthesized, monkeypatch):
+    monkeypatch.setattr(main, "SEGMENT_CACHE", True)
+    marks = marks_for("It costs $5. Mr. Jones paid.")
+    assert len(synthesized) == 2
+    assert [(word["word"], word["sentence"]) for word in marks["words"]] == [
+        ("It", 0), ("costs", 0), ("$5", 0), ("Mr.", 1), ("Jones", 1), ("paid", 1),
+    ]
+    assert [sentence["text"] for sentence in marks["sentences"]] == ["It costs $5.", "Mr. Jones paid."]
+
+
+def test_vtt_cues_use_source_words(synthesized):
+    vtt = main.marks_to_vtt(marks_for("Dr. Smith paid $3 to AT&T."))
+    cue = vtt.splitlines()[3]
+    assert cue.startswith("Dr. <")
+    assert ">$3 <" in cue
+    assert cue.endswith(">AT&amp;T")
+
+
+def test_marks_without_normalization(synthesized, monkeypatch):
+    monkeypatch.setattr(main, "TEXT_NORMALIZATION", False)
+    marks = marks_for("Paid $3, thanks")
+    assert [(word["word"], word["spoken"]) for word in marks["words"]] == [
+        ("Paid", "Paid"), ("$3", "$3"), ("thanks", "thanks"),
+    ]
@@ -0,0 +1,124 @@
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("n, words", [
+    (0, "zero"),
+    (7, "seven"),
+    (19, "nineteen"),
+    (20, "twenty"),
+    (42, "forty-two"),
+    (100, "one hundred"),
+    (305, "three hundred five"),
+    (1000, "one thousand"),
+    (1234, "one thousand two hundred thirty-four"),
+    (2000000, "two million"),
+    (3000000007, "three billion seven"),
+])
+def test_number_words(n, words):
+    assert main.number_words(n) == words
+
+
+@pytest.mark.parametrize("words, ordinal", [
+    ("one", "first"),
+    ("two", "second"),
+    ("three", "third"),
+    ("five", "fifth"),
+    ("twelve", "twelfth"),
+    ("twenty", "twentieth"),
+    ("twenty-one", "twenty-first"),
+    ("one hundred", "one hundredth"),
+])
+def test_ordinal_words(words, ordinal):
+    assert main.ordinal_words(words) == ordinal
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Plain numbers, ordinals and percentages
+    ("I have 3 cats", "I have three cats"),
+    ("It is 1,500 miles", "It is one thousand five hundred miles"),
+    ("Pi is 3.14", "Pi is three point one four"),
+    ("It fell to -4", "It fell to minus four"),
+    ("the 21st century", "the twenty-first century"),
+    ("the 3rd time", "the third time"),
+    ("50% off", "fifty percent off"),
+    # Years, except 2000-2009 which read as plain numbers
+    ("In 1999", "In nineteen ninety-nine"),
+    ("In 1905", "In nineteen oh five"),
+    ("In 1900", "In nineteen hundred"),
+    ("In 2005", "In two thousand five"),
+    ("In 2024", "In twenty twenty-four"),
+    # Zero-padded codes read digit by digit; times and versions are left alone
+    ("Code 007", "Code zero zero seven"),
+    ("Meet at 10:30", "Meet at 10:30"),
+    ("Version 1.2.3", "Version 1.2.3"),
+    ("Room A12", "Room A12"),
+])
+def test_numbers(text, expected):
+    assert main.normalize_text(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("It costs $5.99", "It costs five dollars and ninety-nine cents"),
+    ("$1", "one dollar"),
+    ("$0.99", "ninety-nine cents"),
+    ("$0.01", "one cent"),
+    ("$1,234.50", "one thousand two hundred thirty-four dollars and fifty cents"),
+    ("$1999", "one thousand nine hundred ninety-nine dollars"),
+    ("$1.5 million", "one point five million dollars"),
+    ("$3 billion", "three billion dollars"),
+    ("$2.125", "two point one two five dollars"),
+    ("-$5", "minus five dollars"),
+    ("£1.01", "one pound and one penny"),
+    ("£2.50", "two pounds and fifty pence"),
+    ("€20", "twenty euros"),
+    ("¥1000", "one thousand yen"),
+    # A symbol without a table entry leaves its number as written
+    ("₹500", "₹500"),
+])
+def test_currency(text, expected):
+    assert main.normalize_text(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Dr. Smith", "Doctor Smith"),
+    ("Mr. and Mrs. Jones", "Mister and Missus Jones"),
+    ("Cats vs. dogs", "Cats versus dogs"),
+    ("Fruit, e.g. apples", "Fruit, for example apples"),
+    ("The best, i.e. ours", "The best, that is ours"),
+    # Needs the period, so words that merely start with an abbreviation are untouched
+    ("Drive on", "Drive on"),
+])
+def test_abbreviations(text, expected):
+    assert main.normalize_text(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Case is kept for the engine; only the cache key folds it
+    ("Hello World", "Hello World"),
+    ("NASA launched", "NASA launched"),
+    ("  spaced   out  ", "spaced out"),
+    ("<speak>Hello <break time='1s'/>there</speak>", "Hello there"),
+    ('<sub alias="World Wide Web">WWW</sub>', "World Wide Web"),
+    ("<speak>Fish &amp; chips</speak>", "Fish & chips"),
+])
+def test_markup_case_and_whitespace(text, expected):
+    assert main.normalize_text(text) == expected
+
+
+def test_equivalent_requests_share_a_key():
+    variants = ["Dr. Smith paid $5.99.", "Dr.  Smith paid   $5.99.", "<speak>Dr. Smith paid $5.99.</speak>"]
+    assert len({main.prepare_text(text)[0] for text in variants}) == 1
+
+
+def test_case_variants_share_a_key_but_keep_their_text():
+    variants = ["Hello World", "hello world", "Hello world"]
+    assert [main.prepare_text(text)[0] for text in variants] == variants
+    assert len({main.synthesis_key("Sam", text, 150, 100) for text in variants}) == 1
+    assert main.synthesis_key("Sam", "NASA", 150, 100) != main.synthesis_key("Sam", "nasa", 150, 100)
+
+
+def test_key_keeps_case_without_normalization(monkeypatch):
+    monkeypatch.setattr(main, "TEXT_NORMALIZATION", False)
+    assert main.synthesis_key("Sam", "Hello", 150, 100) != main.synthesis_key("Sam", "hello", 150, 100)
@@ -0,0 +1,62 @@
+import math
+import struct
+
+import pytest
+
+import main
+
+np = pytest.importorskip("numpy")
+
+
+def tone_wav(frequency, sample_rate=22050, seconds=1.0, channels=1):
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    samples = np.rint(0.5 * 32767 * np.sin(2 * math.pi * frequency * t)).astype("<i2")
+    pcm = np.repeat(samples[:, None], channels, axis=1).tobytes()
+    fmt = struct.pack("<HHIIHH", 1, channels, sample_rate, sample_rate * channels * 2, channels * 2, 16)
+    return main.wav_header(fmt, len(pcm)) + pcm
+
+
+def decode(data):
+    fmt, pcm = main.parse_wav(data)
+    _, channels, sample_rate, _ = main.wav_format(fmt)
+    samples = np.frombuffer(pcm, dtype="<i2").reshape(-1, channels).astype(np.float64) / 32768.0
+    return samples, sample_rate
+
+
+def level_db(samples):
+    # RMS away from the edges, where the filter runs into the zero padding
+    middle = samples[len(samples) // 10:-len(samples) // 10]
+    return 20 * math.log10(max(1e-9, float(np.sqrt(np.mean(np.square(middle))))))
+
+
+def test_downsampling_removes_aliases():
+    # 6 kHz is above 8 kHz audio's Nyquist frequency and would fold back to 2 kHz
+    samples, sample_rate = decode(main.process_wav(tone_wav(6000), "8000hz"))
+    assert sample_rate == 8000
+    assert level_db(samples) < -80
+
+
+@pytest.mark.parametrize("frequency, target", [(1000, 8000), (3000, 8000), (6000, 16000)])
+def test_downsampling_keeps_the_passband(frequency, target):
+    source, _ = decode(tone_wav(frequency))
+    samples, _ = decode(main.process_wav(tone_wav(frequency), f"{target}hz"))
+    assert abs(level_db(samples) - level_db(source)) < 0.1
+
+
+@pytest.mark.parametrize("target", [8000, 11025, 16000, 20001])
+def test_downsampling_length(target):
+    samples, sample_rate = decode(main.process_wav(tone_wav(440), f"{target}hz"))
+    assert sample_rate == target
+    assert len(samples) == target
+
+
+def test_downsampling_keeps_channels_in_step():
+    samples, _ = decode(main.process_wav(tone_wav(440, channels=2), "16000hz"))
+    assert samples.shape[1] == 2
+    assert np.array_equal(samples[:, 0], samples[:, 1])
+
+
+def test_upsampling_length():
+    samples, sample_rate = decode(main.process_wav(tone_wav(440), "44100hz"))
+    assert sample_rate == 44100
+    assert len(samples) == 44100
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+BODY = bytes(range(10))
+ETAG = '"abc"'
+
+
+def respond(range_header=None, if_range=None):
+    headers = {}
+    if range_header is not None:
+        headers["range"] = range_header
+    if if_range is not None:
+        headers["if-range"] = if_range
+    return main.ranged_response(SimpleNamespace(headers=headers), BODY, "audio/wav", {"ETag": ETAG})
+
+
+@pytest.mark.parametrize("spec, start, end", [
+    ("bytes=0-3", 0, 3),
+    ("bytes=5-", 5, 9),
+    ("bytes=4-100", 4, 9),
+    ("bytes=-3", 7, 9),
+    ("bytes=-100", 0, 9),
+    ("bytes=9-9", 9, 9),
+    ("BYTES = 2 - 4", 2, 4),
+])
+def test_satisfiable_range(spec, start, end):
+    response = respond(spec)
+    assert response.status_code == 206
+    assert response.body == BODY[start:end + 1]
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{len(BODY)}"
+
+
+@pytest.mark.parametrize("spec", [
+    "bytes=5-3",
+    "bytes=-",
+    "bytes=abc",
+    "bytes=1-x",
+    "bytes=--3",
+    "bytes=1-2-3",
+    "bytes=0-1,4-5",
+    "items=0-3",
+])
+def test_invalid_range_is_ignored(spec):
+    response = respond(spec)
+    assert response.status_code == 200
+    assert response.body == BODY
+    assert "content-range" not in response.headers
+
+
+@pytest.mark.parametrize("spec", ["bytes=10-", "bytes=10-20", "bytes=-0"])
+def test_range_past_end_is_unsatisfiable(spec):
+    response = respond(spec)
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(BODY)}"
+
+
+def test_if_range_mismatch_sends_whole_body():
+    assert respond("bytes=0-3", if_range='"other"').status_code == 200
+    assert respond("bytes=0-3", if_range=ETAG).status_code == 206
+
+
+def test_no_range_sends_whole_body():
+    response = respond()
+    assert response.status_code == 200
+    assert response.headers["accept-ranges"] == "bytes"
@@ -0,0 +1,143 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+
+def connection(host="203.0.113.9", **headers):
+    return SimpleNamespace(headers=headers, client=SimpleNamespace(host=host))
+
+
+def serve_in_order(queue, clients):
+    # Queues every client behind a held slot, then records the order slots are handed out
+    async def run():
+        order = []
+        await queue.acquire("holder")
+
+        async def worker(client, weight):
+            async with queue.slot(client, weight):
+                order.append(client)
+
+        tasks = []
+        for client, weight in clients:
+            tasks.append(asyncio.create_task(worker(client, weight)))
+            await asyncio.sleep(0)
+        queue.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    return asyncio.run(run())
+
+
+def test_fair_queue_interleaves_clients():
+    queue = main.FairQueue(1, max_queued=100, timeout=5)
+    order = serve_in_order(queue, [("a", 1.0)] * 3 + [("b", 1.0)] * 3)
+    assert order == ["a", "b", "a", "b", "a", "b"]
+
+
+def test_flooding_client_does_not_starve_another():
+    queue = main.FairQueue(1, max_queued=100, timeout=5)
+    order = serve_in_order(queue, [("flood", 1.0)] * 20 + [("quiet", 1.0)])
+    # The late arrival waits behind at most one of the flood's requests
+    assert order.index("quiet") <= 1
+
+
+def test_fair_queue_weights_share_slots():
+    queue = main.FairQueue(1, max_queued=100, timeout=5)
+    order = serve_in_order(queue, [("heavy", 2.0)] * 4 + [("light", 1.0)] * 4)
+    assert order[:6].count("heavy") == 4
+    assert order[:6].count("light") == 2
+
+
+def test_fair_queue_sheds_when_full():
+    queue = main.FairQueue(1, max_queued=1, timeout=5)
+
+    async def run():
+        await queue.acquire("holder")
+        waiting = asyncio.create_task(queue.acquire("a"))
+        await asyncio.sleep(0)
+        with pytest.raises(main.UpstreamError) as raised:
+            await queue.acquire("b")
+        queue.release()
+        await waiting
+        return raised.value.status_code
+
+    assert asyncio.run(run()) == 503
+    assert queue.shed == 1
+
+
+def test_fair_queue_times_out():
+    queue = main.FairQueue(1, max_queued=10, timeout=0.01)
+
+    async def run():
+        await queue.acquire("holder")
+        with pytest.raises(main.UpstreamError) as raised:
+            await queue.acquire("a")
+        return raised.value.status_code
+
+    assert asyncio.run(run()) == 503
+    assert queue.shed == 1
+    assert queue.queued == 0
+
+
+def test_token_bucket_refills(clock):
+    limiter = main.RateLimiter(main.MemoryRateLimitStore(), rate=0.5, burst=2)
+    request = connection()
+    assert asyncio.run(limiter.admit(request)) is None
+    assert asyncio.run(limiter.admit(request)) is None
+    response = asyncio.run(limiter.admit(request))
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+    clock.advance(1)
+    # Half a token has come back; Retry-After rounds the remaining second up
+    assert asyncio.run(limiter.check(request)) == pytest.approx(1.0)
+    clock.advance(2)
+    assert asyncio.run(limiter.admit(request)) is None
+    assert limiter.rejected == 2
+
+
+def test_sqlite_bucket_refills(tmp_path):
+    store = main.SQLiteRateLimitStore(str(tmp_path / "limits.db"))
+    assert store._take("ip:a", 1, 1.0, 1, 100.0) == 0
+    assert store._take("ip:a", 1, 1.0, 1, 100.5) == pytest.approx(0.5)
+    assert store._take("ip:a", 1, 1.0, 1, 101.5) == 0
+
+
+def test_one_client_exhausting_its_bucket_leaves_others_alone(clock):
+    limiter = main.RateLimiter(main.MemoryRateLimitStore(), rate=1, burst=3)
+    flood = connection("198.51.100.1")
+    for _ in range(10):
+        asyncio.run(limiter.check(flood))
+    assert asyncio.run(limiter.check(flood)) > 0
+    assert asyncio.run(limiter.check(connection("198.51.100.2"))) == 0
+
+
+def test_forwarded_for_ignored_without_trusted_proxy(monkeypatch):
+    monkeypatch.setattr(main, "RATE_LIMIT_TRUST_PROXY", 0)
+    request = connection("10.0.0.1", **{"x-forwarded-for": "198.51.100.7"})
+    assert main.rate_limiter.identify(request) == ("ip:10.0.0.1", 1.0)
+
+
+@pytest.mark.parametrize("hops, forwarded, address", [
+    (1, "198.51.100.7", "198.51.100.7"),
+    (1, "1.1.1.1, 198.51.100.7", "198.51.100.7"),
+    (2, "1.1.1.1, 198.51.100.7, 10.0.0.2", "198.51.100.7"),
+    (2, "198.51.100.7", "198.51.100.7"),
+])
+def test_forwarded_for_uses_proxy_appended_entry(monkeypatch, hops, forwarded, address):
+    monkeypatch.setattr(main, "RATE_LIMIT_TRUST_PROXY", hops)
+    request = connection("10.0.0.1", **{"x-forwarded-for": forwarded})
+    assert main.rate_limiter.identify(request) == (f"ip:{address}", 1.0)
+
+
+def test_spoofed_forwarded_for_shares_one_bucket(monkeypatch, clock):
+    monkeypatch.setattr(main, "RATE_LIMIT_TRUST_PROXY", 1)
+    limiter = main.RateLimiter(main.MemoryRateLimitStore(), rate=1, burst=2)
+    results = [
+        asyncio.run(limiter.check(connection("10.0.0.1", **{"x-forwarded-for": f"192.0.2.{i}, 198.51.100.7"})))
+        for i in range(3)
+    ]
+    assert results[:2] == [0, 0]
+    assert results[2] > 0
@@ -0,0 +1,228 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+
+URL = "http://upstream.test/SAPI4/SAPI4"
+
+
+class TrackedStream(httpx.AsyncByteStream):
+    def __init__(self, body=b""):
+        self.body = body
+        self.closed = False
+
+    async def __aiter__(self):
+        yield self.body
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    # Routes the backend's shared client through a handler the test sets
+    calls = []
+    state = {"handler": None}
+
+    async def dispatch(request):
+        calls.append(request)
+        return await state["handler"](len(calls))
+
+    monkeypatch.setattr(main, "httpx", httpx)
+    monkeypatch.setattr(main, "upstream_client", httpx.AsyncClient(transport=httpx.MockTransport(dispatch)))
+
+    def use(handler):
+        state["handler"] = handler
+        return calls
+
+    return use
+
+
+def backend():
+    return main.SAPI4Backend("tetyys", URL, ["Sam"], 4)
+
+
+def test_breaker_opens_on_error_rate(clock):
+    breaker = main.CircuitBreaker(window=10, min_requests=4, error_rate=0.5, cooldown=5)
+    breaker.record_success()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_breaker_needs_min_requests(clock):
+    breaker = main.CircuitBreaker(window=10, min_requests=4, error_rate=0.5, cooldown=5)
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_breaker_forgets_outcomes_outside_window(clock):
+    breaker = main.CircuitBreaker(window=10, min_requests=4, error_rate=0.5, cooldown=5)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.advance(11)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    assert len(breaker.outcomes) == 1
+
+
+def test_breaker_lets_one_probe_through_after_cooldown(clock):
+    breaker = main.CircuitBreaker(window=10, min_requests=1, error_rate=0.5, cooldown=5)
+    breaker.record_failure()
+    clock.advance(4.9)
+    assert not breaker.allow()
+    clock.advance(0.2)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = main.CircuitBreaker(window=10, min_requests=1, error_rate=0.5, cooldown=5)
+    breaker.record_failure()
+    clock.advance(5)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    clock.advance(5)
+    assert breaker.allow()
+
+
+def test_retry_budget_floor(clock):
+    budget = main.RetryBudget(window=10, ratio=0.2, minimum=3)
+    assert [budget.try_spend() for _ in range(4)] == [True, True, True, False]
+    assert budget.exhausted == 1
+
+
+def test_retry_budget_ratio(clock):
+    budget = main.RetryBudget(window=10, ratio=0.2, minimum=1)
+    for _ in range(10):
+        budget.record_request()
+    # One from the floor plus 20% of ten requests
+    assert [budget.try_spend() for _ in range(4)] == [True, True, True, False]
+
+
+def test_retry_budget_refills_after_window(clock):
+    budget = main.RetryBudget(window=10, ratio=0.2, minimum=1)
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    clock.advance(11)
+    assert budget.try_spend()
+
+
+def test_client_error_counts_as_success(upstream):
+    async def handler(call):
+        return httpx.Response(400)
+
+    calls = upstream(handler)
+    sapi4 = backend()
+    with pytest.raises(main.UpstreamError) as raised:
+        asyncio.run(sapi4.open_upstream({"text": "hi"}))
+    assert raised.value.status_code == 400
+    assert len(calls) == 1
+    assert [ok for _, ok in sapi4.breaker.outcomes] == [True]
+
+
+def test_server_error_counts_as_failure(upstream, monkeypatch):
+    monkeypatch.setattr(main, "UPSTREAM_MAX_RETRIES", 0)
+
+    async def handler(call):
+        return httpx.Response(503)
+
+    upstream(handler)
+    sapi4 = backend()
+    with pytest.raises(main.UpstreamError) as raised:
+        asyncio.run(sapi4.open_upstream({"text": "hi"}))
+    assert raised.value.status_code == 503
+    assert [ok for _, ok in sapi4.breaker.outcomes] == [False]
+
+
+def test_open_breaker_rejects_without_calling_upstream(upstream):
+    calls = upstream(None)
+    sapi4 = backend()
+    sapi4.breaker._open()
+    with pytest.raises(main.UpstreamError) as raised:
+        asyncio.run(sapi4.open_upstream({"text": "hi"}))
+    assert raised.value.status_code == 503
+    assert calls == []
+
+
+def hedging_backend(monkeypatch):
+    monkeypatch.setattr(main, "UPSTREAM_HEDGE", True)
+    monkeypatch.setattr(main, "HEDGE_MIN_DELAY", 0.01)
+    sapi4 = backend()
+    for _ in range(main.HEDGE_MIN_SAMPLES):
+        sapi4.latency.observe(0.001)
+    return sapi4
+
+
+def test_losing_hedge_response_is_closed(upstream, monkeypatch):
+    first = TrackedStream()
+
+    async def handler(call):
+        # The first request fails after the hedge goes out, the hedge then succeeds
+        if call == 1:
+            await asyncio.sleep(0.03)
+            return httpx.Response(503, stream=first)
+        await asyncio.sleep(0.06)
+        return httpx.Response(200, content=b"audio")
+
+    calls = upstream(handler)
+    sapi4 = hedging_backend(monkeypatch)
+
+    async def run():
+        response = await sapi4.send_hedged({"text": "hi"})
+        return response.status_code
+
+    assert asyncio.run(run()) == 200
+    assert len(calls) == 2
+    assert first.closed
+    assert sapi4.retry_budget.hedges == 1
+
+
+def test_pending_hedge_is_cancelled(upstream, monkeypatch):
+    cancelled = []
+
+    async def handler(call):
+        if call == 1:
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append(call)
+                raise
+        return httpx.Response(200, content=b"audio")
+
+    upstream(handler)
+    sapi4 = hedging_backend(monkeypatch)
+
+    async def run():
+        response = await sapi4.send_hedged({"text": "hi"})
+        await asyncio.sleep(0.01)
+        return response.status_code
+
+    assert asyncio.run(run()) == 200
+    assert cancelled == [1]
+
+
+def test_no_hedge_without_budget(upstream, monkeypatch):
+    async def handler(call):
+        await asyncio.sleep(0.03)
+        return httpx.Response(200, content=b"audio")
+
+    calls = upstream(handler)
+    sapi4 = hedging_backend(monkeypatch)
+    sapi4.retry_budget = main.RetryBudget(window=10, ratio=0, minimum=0)
+    assert asyncio.run(sapi4.send_hedged({"text": "hi"})).status_code == 200
+    assert len(calls) == 1
+    assert sapi4.retry_budget.exhausted == 1
@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+import main
+
+KEY = "a" * 64
+AUDIO = b"RIFF-audio"
+
+
+class BrokenStore:
+    name = "broken"
+
+    async def get(self, key):
+        raise ConnectionError("store unreachable")
+
+    async def set(self, key, data):
+        raise ConnectionError("store unreachable")
+
+    async def try_lock(self, key, owner, ttl):
+        raise ConnectionError("store unreachable")
+
+    async def unlock(self, key, owner):
+        raise ConnectionError("store unreachable")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return main.MemorySharedStore()
+    return main.SQLiteSharedStore(str(tmp_path / "shared.sqlite3"), 0)
+
+
+def worker(store):
+    # One SynthesisCache per simulated worker process, all pointed at the same store
+    return main.SynthesisCache(1 << 20, 1 << 20, shared=store)
+
+
+def test_one_leader_per_key(store):
+    async def run():
+        workers = [worker(store) for _ in range(3)]
+        claims = [asyncio.create_task(cache.claim(KEY)) for cache in workers]
+        await asyncio.sleep(main.SHARED_LOCK_POLL * 3)
+        leaders = [cache for cache, claim in zip(workers, claims) if claim.done() and claim.result() == (None, True)]
+        assert len(leaders) == 1
+        assert sum(claim.done() for claim in claims) == 1
+        await leaders[0].set(KEY, AUDIO)
+        await leaders[0].release(KEY)
+        results = await asyncio.gather(*claims)
+        return workers, leaders[0], results
+
+    workers, leader, results = asyncio.run(run())
+    assert sorted(results, key=lambda result: result[1]) == [(AUDIO, False), (AUDIO, False), (None, True)]
+    for cache in workers:
+        if cache is not leader:
+            assert cache.shared_waits == 1
+            assert cache.entries[KEY] == AUDIO
+
+
+def test_loser_picks_up_winner_result(store):
+    async def run():
+        leader, loser = worker(store), worker(store)
+        assert await leader.claim(KEY) == (None, True)
+        waiting = asyncio.create_task(loser.claim(KEY))
+        await asyncio.sleep(main.SHARED_LOCK_POLL * 2)
+        assert not waiting.done()
+        await leader.set(KEY, AUDIO)
+        await leader.release(KEY)
+        return await waiting, loser
+
+    result, loser = asyncio.run(run())
+    assert result == (AUDIO, False)
+    assert loser.shared_hits == 1
+
+
+def test_claim_returns_audio_already_in_store(store):
+    async def run():
+        await store.set(KEY, AUDIO)
+        return await worker(store).claim(KEY)
+
+    assert asyncio.run(run()) == (AUDIO, False)
+
+
+def test_lock_expires_after_ttl(store, clock):
+    async def run():
+        crashed, other = worker(store), worker(store)
+        # The first worker takes the lock and never releases it
+        assert await crashed.claim(KEY) == (None, True)
+        assert not await store.try_lock(KEY, other.owner, main.SHARED_LOCK_TTL)
+        clock.advance(main.SHARED_LOCK_TTL + 1)
+        return await other.claim(KEY)
+
+    assert asyncio.run(run()) == (None, True)
+
+
+def test_unlock_only_releases_own_lock(store):
+    async def run():
+        assert await store.try_lock(KEY, "first", 60)
+        await store.unlock(KEY, "second")
+        assert not await store.try_lock(KEY, "second", 60)
+        await store.unlock(KEY, "first")
+        return await store.try_lock(KEY, "second", 60)
+
+    assert asyncio.run(run())
+
+
+def test_store_failure_skips_deduplication():
+    async def run():
+        cache = worker(BrokenStore())
+        assert await cache.get(KEY) is None
+        await cache.set(KEY, AUDIO)
+        claimed = await cache.claim(KEY)
+        await cache.release(KEY)
+        return claimed
+
+    assert asyncio.run(run()) == (None, False)
+
+
+def test_store_failure_falls_back_to_local_synthesis(monkeypatch):
+    calls = []
+
+    async def synthesize(broadcast, voice, text, pitch, speed):
+        calls.append(text)
+        broadcast.start(len(AUDIO))
+        broadcast.publish(AUDIO)
+        broadcast.finish()
+
+    monkeypatch.setattr(main, "synthesis_cache", worker(BrokenStore()))
+    monkeypatch.setattr(main, "stream_from_backends", synthesize)
+
+    async def run():
+        chunks, length, status = await main.open_synthesis("Sam", "store is down", 150, 100)
+        return b"".join([chunk async for chunk in chunks]), length, status
+
+    assert asyncio.run(run()) == (AUDIO, len(AUDIO), "MISS")
+    assert calls == ["store is down"]
+    assert main.synthesis_cache.entries[main.synthesis_key("Sam", "store is down", 150, 100)] == AUDIO